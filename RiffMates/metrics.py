@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import socket
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from time import monotonic, perf_counter
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+from api_auth import metrics_key
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Per-route request latency histograms plus SQL query counts and time.
+#
+# Each process counts into plain lists in memory and every FLUSH_INTERVAL
+# seconds writes them to its own file in settings.METRICS_DIR, named after
+# the host, the pid and a random id, so a process reusing the pid of one
+# that is gone starts a file of its own. The scrape endpoint adds up the
+# files of all processes. It first adds the files of processes on this host
+# that are gone to retired.json and deletes them, so the totals never go
+# backwards and files don't pile up (not on Windows, where they're kept).
+#
+# Only staff users and API keys with the "metrics" scope may scrape.
+#
+# Requests only hand the write to a background thread, so it never holds up
+# a response or blocks the event loop, and a METRICS_DIR that can't be
+# written is logged instead of failing requests.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FLUSH_INTERVAL = 5  # seconds
+
+# [SQL query count, SQL seconds] of the request being handled
+_sql = ContextVar("metrics_sql", default=None)
+
+logger = logging.getLogger(__name__)
+
+RETIRED = "retired.json"
+HOST = socket.gethostname()
+
+
+def _start():
+    # Also run in forked children, which must neither share the parent's
+    # file nor count its requests again, and whose flusher thread doesn't
+    # exist
+    global _lock, _routes, _last_flush, _flusher, _file_name
+
+    _lock = Lock()
+    _routes = {}
+    _last_flush = monotonic()
+    _flusher = ThreadPoolExecutor(1, thread_name_prefix="metrics")
+    _file_name = f"{HOST}-{os.getpid()}-{uuid4().hex}.json"
+
+
+_start()
+os.register_at_fork(after_in_child=_start)
+
+
+def _new_route():
+    # Histogram counts (not cumulative, the last one is +Inf), then the
+    # request count, seconds, SQL query count and SQL seconds
+    return [[0] * (len(BUCKETS) + 1), 0, 0.0, 0, 0.0]
+
+
+def _record_sql(execute, sql, params, many, context):
+    counters = _sql.get()
+    if counters is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counters[0] += 1
+        counters[1] += perf_counter() - start
+
+
+def _install(connection):
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+@receiver(connection_created)
+def install_sql_wrapper(sender, connection, **kwargs):
+    _install(connection)
+
+
+def _record(request, elapsed, counters):
+    # The request's own response or error is what counts
+    try:
+        _count(request, elapsed, counters)
+    except Exception:
+        logger.exception("Recording metrics failed")
+
+
+def _count(request, elapsed, counters):
+    global _last_flush
+
+    match = request.resolver_match
+    route = match.view_name if match else "unresolved"
+
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = _new_route()
+        stats[0][bisect_left(BUCKETS, elapsed)] += 1
+        stats[1] += 1
+        stats[2] += elapsed
+        stats[3] += counters[0]
+        stats[4] += counters[1]
+
+        # Claimed under the lock so only one request submits the flush
+        due = monotonic() - _last_flush > FLUSH_INTERVAL
+        if due:
+            _last_flush = monotonic()
+
+    if due:
+        _flusher.submit(_safe_flush)
+
+
+def _safe_flush():
+    try:
+        flush()
+    except OSError:
+        logger.exception("Writing metrics to %s failed", settings.METRICS_DIR)
+
+
+def flush():
+    """Write this process's counters to its file in settings.METRICS_DIR."""
+    global _last_flush
+
+    with _lock:
+        _last_flush = monotonic()
+        data = json.dumps(_routes)
+
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    _write(directory / _file_name, data)
+
+
+def _write(path, data):
+    # Written to a temporary file and renamed, so readers never see half a
+    # file
+    with NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def _read(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _add(totals, routes):
+    for route, stats in routes.items():
+        total = totals.setdefault(route, _new_route())
+        total[0] = [a + b for a, b in zip(total[0], stats[0])]
+        for index in range(1, 5):
+            total[index] += stats[index]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Another user's process
+        pass
+    return True
+
+
+def _gone(path):
+    # Files of this host's processes that no longer run
+    parts = path.stem.rsplit("-", 2)
+    if len(parts) != 3:
+        return False
+    host, pid, _ = parts
+    return host == HOST and pid.isdigit() and not _alive(int(pid))
+
+
+def retire():
+    """Add the files in settings.METRICS_DIR of processes on this host that
+    are gone to retired.json, and delete them.
+    """
+    directory = Path(settings.METRICS_DIR)
+    if fcntl is None or not directory.is_dir():
+        return
+
+    # One process at a time, the others would add the same files again
+    with open(directory / ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        gone = [path for path in directory.glob("*.json") if _gone(path)]
+        if not gone:
+            return
+
+        retired = _read(directory / RETIRED)
+        for path in gone:
+            _add(retired, _read(path))
+        _write(directory / RETIRED, json.dumps(retired))
+        for path in gone:
+            path.unlink()
+
+
+def collect():
+    """Counters of all processes added up, by route."""
+    totals = {}
+    for path in Path(settings.METRICS_DIR).glob("*.json"):
+        _add(totals, _read(path))
+
+    return totals
+
+
+def _label(route):
+    escaped = route.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'route="{escaped}"'
+
+
+def render(totals):
+    """Format ``totals`` in the Prometheus text exposition format."""
+    lines = [
+        "# HELP riffmates_request_duration_seconds Request latency by route.",
+        "# TYPE riffmates_request_duration_seconds histogram",
+    ]
+    for route, (counts, count, seconds, _, _) in sorted(totals.items()):
+        label = _label(route)
+        cumulative = 0
+        for bound, bucket in zip((*BUCKETS, "+Inf"), counts):
+            cumulative += bucket
+            lines.append(
+                f'riffmates_request_duration_seconds_bucket{{{label},le="{bound}"}} '
+                f"{cumulative}"
+            )
+        lines.append(f"riffmates_request_duration_seconds_sum{{{label}}} {seconds}")
+        lines.append(f"riffmates_request_duration_seconds_count{{{label}}} {count}")
+
+    lines += [
+        "# HELP riffmates_sql_queries_total SQL queries run by route.",
+        "# TYPE riffmates_sql_queries_total counter",
+    ]
+    for route, stats in sorted(totals.items()):
+        lines.append(f"riffmates_sql_queries_total{{{_label(route)}}} {stats[3]}")
+
+    lines += [
+        "# HELP riffmates_sql_duration_seconds_total Time spent in SQL by route.",
+        "# TYPE riffmates_sql_duration_seconds_total counter",
+    ]
+    for route, stats in sorted(totals.items()):
+        lines.append(
+            f"riffmates_sql_duration_seconds_total{{{_label(route)}}} {stats[4]}"
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    if not (request.user.is_staff or metrics_key(request)):
+        return HttpResponseForbidden()
+
+    # Include this process's latest numbers
+    _safe_flush()
+    try:
+        retire()
+    except OSError:
+        logger.exception("Retiring metrics in %s failed", settings.METRICS_DIR)
+    return HttpResponse(
+        render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+class MetricsMiddleware:
+    """Times every request and counts its SQL queries, by the view name of
+    the URL pattern that matched. Works for sync and async requests, SQL
+    run in sync_to_async threads is counted through the context variable.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        # Connections opened before the middleware was loaded
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        counters = [0, 0.0]
+        token = _sql.set(counters)
+        start = perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            elapsed = perf_counter() - start
+            _sql.reset(token)
+            _record(request, elapsed, counters)
+
+    async def __acall__(self, request):
+        counters = [0, 0.0]
+        token = _sql.set(counters)
+        start = perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            elapsed = perf_counter() - start
+            _sql.reset(token)
+            _record(request, elapsed, counters)
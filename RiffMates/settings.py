@@ -11,9 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from tempfile import gettempdir
 from decouple import config
 
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -57,12 +57,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "RiffMates.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "bands.middleware.PermissionsMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -160,7 +162,56 @@ MEDIA_URL = "/media/"
 
 
 # API CONFIG
-NINJA_API_KEY = config("NINJA_API_KEY")
+# Shared key accepted alongside the per-integrator keys stored in
+# home.APIKey, leave it empty to disable it
+NINJA_API_KEY = config("NINJA_API_KEY", default="")
+
+# Number of reverse proxies in front of the app. Throttling identifies
+# anonymous clients by the address the nearest proxy saw, the rest of
+# X-Forwarded-For is set by the client. With 0 only REMOTE_ADDR is used
+NINJA_NUM_PROXIES = config("NUM_PROXIES", default=0, cast=int)
+
+# Token bucket sizes for throttling.py, as requests per s, min or hour. A
+# client can burst the full amount, then gets tokens back at that rate
+THROTTLE_RATES = {
+    "search": config("THROTTLE_SEARCH_RATE", default="60/min"),
+    "api-list": config("THROTTLE_API_LIST_RATE", default="120/min"),
+    "api-bulk": config("THROTTLE_API_BULK_RATE", default="30/min"),
+    "api-export": config("THROTTLE_API_EXPORT_RATE", default="10/hour"),
+}
+
+
+# UPLOAD CONFIG
+# Limits on uploaded musician and venue pictures, checked against the file
+# and image header before anything is decoded. Uploads above
+# FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a temporary file rather
+# than held in memory
+PICTURE_MAX_BYTES = config("PICTURE_MAX_BYTES", default=10 * 1024 * 1024, cast=int)
+PICTURE_MAX_PIXELS = config("PICTURE_MAX_PIXELS", default=24_000_000, cast=int)
+# Stored pictures are scaled down to fit this many pixels on a side
+PICTURE_MAX_SIDE = config("PICTURE_MAX_SIDE", default=2048, cast=int)
+
+
+# METRICS CONFIG
+# Each worker process writes its request metrics here for /metrics/ to add
+# up, so all workers on a host need to share the directory
+METRICS_DIR = config(
+    "METRICS_DIR", default=str(Path(gettempdir()) / "riffmates-metrics")
+)
+
+
+# CACHE CONFIG
+# API version counters live in the cache, so deployments running more than
+# one worker process need a shared backend (e.g. Redis or Memcached). The
+# versions.W001 check warns about LocMemCache when DEBUG is off
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    }
+}
 
 
 # DEBUG CONFIG
@@ -23,11 +23,15 @@ from django.views.generic.base import RedirectView
 
 from ninja import NinjaAPI
 
+from api_serializers import FastJSONRenderer
+
+from RiffMates.metrics import metrics
+
 from home.api import router as home_router
 from promoters.api import router as promoters_router
 from bands.api import router as bands_router
 
-api = NinjaAPI(version="1.0")
+api = NinjaAPI(version="1.0", renderer=FastJSONRenderer())
 api.add_router("/home/", home_router)
 api.add_router("/promoters/", promoters_router)
 api.add_router("/bands/", bands_router)
@@ -42,6 +46,7 @@ urlpatterns = [
     path("content/", include("content.urls")),
     path("api/v1/", api.urls),
     path("promoters/", include("promoters.urls")),
+    path("metrics/", metrics, name="metrics"),
     path("__debug__/", include("debug_toolbar.urls")),
 ]
 
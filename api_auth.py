@@ -1,14 +1,124 @@
+import hmac
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic, time
+
 from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 from ninja.security import APIKeyHeader
 
+from home.models import APIKey as StoredKey, hash_key
+
+CACHE_SIZE = 256
+CACHE_TTL = 60  # seconds
+
+
+@dataclass(frozen=True)
+class Credentials:
+    key_id: str
+    scopes: frozenset
+    expires: float | None = None  # Unix timestamp
+
+
+class KeyCache:
+    """Small LRU of verified keys so a known key costs a dictionary lookup
+    instead of a query and a hash. Entries live for at most ``ttl``
+    seconds, which bounds how long another process may keep using a key
+    after it is revoked.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, raw_key):
+        with self.lock:
+            entry = self.entries.get(raw_key)
+            if entry is None:
+                return None
+
+            cached_at, credentials = entry
+            if monotonic() - cached_at > self.ttl:
+                del self.entries[raw_key]
+                return None
+
+            self.entries.move_to_end(raw_key)
+            return credentials
+
+    def set(self, raw_key, credentials):
+        with self.lock:
+            self.entries[raw_key] = (monotonic(), credentials)
+            self.entries.move_to_end(raw_key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+key_cache = KeyCache()
+
+
+def _lookup(raw_key):
+    legacy_key = settings.NINJA_API_KEY
+    # Compared as bytes, compare_digest() refuses non-ASCII strings
+    if legacy_key and hmac.compare_digest(raw_key.encode(), legacy_key.encode()):
+        # The single shared key from settings, kept working while
+        # integrators move to their own keys
+        return Credentials("settings", frozenset({"*"}))
+
+    prefix, _, _ = raw_key.partition(".")
+    stored = StoredKey.objects.filter(prefix=prefix).first()
+    if stored is None or not stored.is_active:
+        return None
+    if not hmac.compare_digest(hash_key(raw_key), stored.hashed_key):
+        return None
+
+    expires = stored.expires.timestamp() if stored.expires else None
+    return Credentials(stored.prefix, frozenset(stored.scopes.split()), expires)
+
 
 class APIKey(APIKeyHeader):
     param_name = "X-API-KEY"
 
+    def __init__(self, scope=None):
+        self.scope = scope
+        super().__init__()
+
     def authenticate(self, request, key):
-        if key == settings.NINJA_API_KEY:
-            return key
+        if not key:
+            return None
+
+        credentials = key_cache.get(key)
+        if credentials is None:
+            credentials = _lookup(key)
+            if credentials is None:
+                return None
+            key_cache.set(key, credentials)
+
+        if credentials.expires is not None and credentials.expires <= time():
+            return None
+        if self.scope and not credentials.scopes & {self.scope, "*"}:
+            return None
+
+        return credentials
+
+
+@receiver([post_save, post_delete], sender=StoredKey)
+def api_key_changed(sender, **kwargs):
+    # Revocations and scope changes take effect at once in this process,
+    # other processes pick them up when their cache entry expires
+    key_cache.clear()
 
 
-api_key = APIKey()
+api_key = APIKey(scope="write")
+# For the whole table exports mirrored by internal jobs
+read_key = APIKey(scope="read")
+# For the /metrics/ scrape endpoint, see RiffMates.metrics
+metrics_key = APIKey(scope="metrics")
@@ -0,0 +1,39 @@
+from ninja.errors import HttpError
+
+from api_serializers import aserialize_in_bulk, renderer
+
+MAX_IDS = 100
+
+
+def parse_ids(value):
+    """Turn a ``?ids=1,2,3`` query value into a list of unique ids, in the
+    order given.
+    """
+    try:
+        ids = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HttpError(400, "ids must be a comma separated list of integers")
+
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HttpError(400, "No ids given")
+    if len(ids) > MAX_IDS:
+        raise HttpError(400, f"At most {MAX_IDS} ids can be fetched at once")
+
+    return ids
+
+
+async def batch_response(response, queryset, schema, ids, fields=None):
+    """Render the rows of ``queryset`` with the given ``ids`` into the
+    operation's temporal ``response`` as ``{"results": [...], "missing":
+    [...]}``. Results are in the order of ``ids``, and ids with no row are
+    listed in missing. All rows are loaded with one query, plus one per
+    related list.
+    """
+    found = await aserialize_in_bulk(queryset, schema, ids, fields)
+    data = {
+        "results": [found[pk] for pk in ids if pk in found],
+        "missing": [pk for pk in ids if pk not in found],
+    }
+    response.content = renderer.render(None, data, response_status=200)
+    return response
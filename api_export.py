@@ -0,0 +1,29 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from api_optimize import optimize
+
+CHUNK_SIZE = 1000
+
+
+def ndjson_response(request, queryset, schema, chunk_size=CHUNK_SIZE):
+    """Stream ``queryset`` serialized with ``schema`` as newline-delimited
+    JSON. Rows are fetched ``chunk_size`` at a time and related objects are
+    prefetched per chunk, so memory use doesn't depend on the table size.
+
+    Each handler buffers the other kind of iterator in full, so ASGI
+    requests get an async iterator over the async ORM and WSGI requests a
+    sync one.
+    """
+    queryset = optimize(queryset, schema).order_by("pk")
+
+    def lines():
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            yield schema.from_orm(obj).model_dump_json() + "\n"
+
+    async def alines():
+        async for obj in queryset.aiterator(chunk_size=chunk_size):
+            yield schema.from_orm(obj).model_dump_json() + "\n"
+
+    content = alines() if isinstance(request, ASGIRequest) else lines()
+    return StreamingHttpResponse(content, content_type="application/x-ndjson")
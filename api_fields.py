@@ -0,0 +1,51 @@
+from copy import copy
+from functools import lru_cache
+from inspect import getattr_static
+
+from ninja import Schema
+from ninja.errors import HttpError
+
+from api_serializers import renderer
+
+
+def parse_fields(schema, value):
+    """Turn a ``?fields=a,b`` query value into a frozenset of ``schema``
+    field names, or None when every field was asked for.
+    """
+    if not value:
+        return None
+
+    fields = frozenset(name.strip() for name in value.split(",") if name.strip())
+    unknown = fields - schema.model_fields.keys()
+    if unknown:
+        raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    return fields or None
+
+
+@lru_cache(maxsize=None)
+def sparse_schema(schema, fields):
+    # Builds a Schema holding just ``fields`` of ``schema``, keeping their
+    # aliases and resolve_* methods
+    namespace = {"__module__": schema.__module__, "__annotations__": {}}
+    for name, info in schema.model_fields.items():
+        if name not in fields:
+            continue
+
+        namespace["__annotations__"][name] = info.annotation
+        namespace[name] = copy(info)
+
+        resolver = getattr_static(schema, f"resolve_{name}", None)
+        if resolver is not None:
+            namespace[f"resolve_{name}"] = resolver
+
+    return type(Schema)(f"{schema.__name__}Fields", (Schema,), namespace)
+
+
+def sparse_response(response, obj, schema, fields):
+    """Render ``obj`` with only ``fields`` of ``schema`` into the
+    operation's temporal ``response``, which Ninja then returns as is.
+    """
+    content = sparse_schema(schema, fields).from_orm(obj).model_dump()
+    response.content = renderer.render(None, content, response_status=200)
+    return response
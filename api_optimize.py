@@ -0,0 +1,108 @@
+from functools import lru_cache
+from types import UnionType
+from typing import Union, get_args, get_origin
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+
+from ninja import Schema
+
+
+def nested_schema(annotation):
+    # Unwraps list[X], Optional[X] and friends down to a Schema class
+    if isinstance(annotation, type) and issubclass(annotation, Schema):
+        return annotation
+
+    if get_origin(annotation) in (list, tuple, set, Union, UnionType):
+        for arg in get_args(annotation):
+            schema = nested_schema(arg)
+            if schema is not None:
+                return schema
+
+    return None
+
+
+def model_attribute(model, name):
+    # Resolves a schema attribute to a model field, including reverse
+    # relations which are exposed under their accessor name (e.g. room_set)
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        pass
+
+    for rel in model._meta.related_objects:
+        if rel.get_accessor_name() == name:
+            return rel
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def _plan(model, schema, prefix="", fields=None):
+    """Work out the columns to load and the relations to join or prefetch
+    for serializing ``model`` instances with ``schema``, or only its
+    ``fields`` when given.
+
+    Returns a tuple of (only, select_related, prefetches) where each
+    prefetch is a (lookup, related model, nested schema, join field) tuple.
+    Schema fields that don't map to a model field (such as values
+    computed by a resolve_* method) are left alone.
+    """
+    only = [prefix + model._meta.pk.name]
+    select = []
+    prefetches = []
+
+    for name, info in schema.model_fields.items():
+        if fields is not None and name not in fields:
+            continue
+
+        attr = info.alias or name
+        field = model_attribute(model, attr)
+        if field is None:
+            continue
+
+        nested = nested_schema(info.annotation)
+        if not field.is_relation:
+            only.append(prefix + attr)
+        elif nested is None:
+            # Relation serialized as its raw key, no need to load the row
+            if field.concrete and not field.many_to_many:
+                only.append(prefix + attr)
+        elif field.many_to_many or field.one_to_many:
+            join = None
+            if field.one_to_many:
+                # Prefetching a reverse foreign key matches rows on the
+                # foreign key column, so it has to be loaded
+                join = field.field.name
+            prefetches.append((prefix + attr, field.related_model, nested, join))
+        else:
+            # Forward foreign key or one-to-one in either direction
+            select.append(prefix + attr)
+            sub_only, sub_select, sub_prefetches = _plan(
+                field.related_model, nested, f"{prefix}{attr}__"
+            )
+            only.extend(sub_only)
+            select.extend(sub_select)
+            prefetches.extend(sub_prefetches)
+
+    return tuple(only), tuple(select), tuple(prefetches)
+
+
+def optimize(queryset, schema, extra_fields=(), fields=None):
+    """Apply the select_related(), prefetch_related() and only() calls
+    needed to serialize ``queryset`` with ``schema`` in a constant number
+    of queries. ``extra_fields`` are loaded on top of the schema's columns.
+    ``fields`` limits the work to a subset of the schema's fields.
+    """
+    only, select, prefetches = _plan(queryset.model, schema, fields=fields)
+
+    queryset = queryset.only(*only, *extra_fields)
+    if select:
+        queryset = queryset.select_related(*select)
+
+    for lookup, related_model, nested, join in prefetches:
+        extra = (join,) if join is not None else ()
+        related = optimize(related_model._default_manager.all(), nested, extra)
+        queryset = queryset.prefetch_related(Prefetch(lookup, queryset=related))
+
+    return queryset
@@ -0,0 +1,134 @@
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from typing import Optional
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from ninja import Field, Schema
+from ninja.errors import HttpError
+
+
+class CursorParams(Schema):
+    after: Optional[str] = None
+    limit: Optional[int] = Field(None, ge=1, le=100)
+
+    @property
+    def enabled(self):
+        return self.after is not None or self.limit is not None
+
+
+DEFAULT_LIMIT = 20
+
+
+def encode_cursor(values):
+    # Cursors are opaque to clients, they're just the sort key of the
+    # last row on the page
+    raw = json.dumps(values, separators=(",", ":"), cls=DjangoJSONEncoder).encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def finite_float(value):
+    # Converter for cursors holding full-text search ranks, float() alone
+    # lets NaN and infinity through
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError("Rank isn't finite")
+    return value
+
+
+def decode_cursor(cursor, converters):
+    """The values of ``cursor``, each passed through its converter, e.g.
+    ``(float, int)`` or the ``to_python`` of the sort fields. Cursors that
+    don't decode, or have values the converters reject, are a 400 rather
+    than an error in the query.
+    """
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(urlsafe_b64decode(cursor + padding))
+    except (BinasciiError, ValueError):
+        raise HttpError(400, "Invalid cursor")
+
+    if not isinstance(values, list) or len(values) != len(converters):
+        raise HttpError(400, "Invalid cursor")
+
+    try:
+        if any(value is None for value in values):
+            raise ValueError("Null sort key")
+        return [convert(value) for convert, value in zip(converters, values)]
+    except (TypeError, ValueError, ValidationError):
+        raise HttpError(400, "Invalid cursor")
+
+
+def _after_q(ordering, values):
+    # Builds the row-value comparison (a, b, c) > (x, y, z) as
+    # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+    q = Q()
+    for index, field in enumerate(ordering):
+        exact = {name: value for name, value in zip(ordering[:index], values)}
+        q |= Q(**exact, **{f"{field}__gt": values[index]})
+
+    return q
+
+
+def _page_queryset(queryset, params, ordering):
+    limit = params.limit or DEFAULT_LIMIT
+    queryset = queryset.order_by(*ordering)
+    if params.after:
+        opts = queryset.model._meta
+        fields = [
+            opts.pk if name == "pk" else opts.get_field(name) for name in ordering
+        ]
+        values = decode_cursor(params.after, [field.to_python for field in fields])
+        queryset = queryset.filter(_after_q(ordering, values))
+
+    # Fetch one extra row to find out whether there is a next page
+    # without a COUNT(*)
+    return queryset[: limit + 1], limit
+
+
+def _set_next_link(request, response, keys, limit):
+    # ``keys`` are the sort keys of the rows fetched, one more than
+    # ``limit`` when there is a next page
+    if len(keys) <= limit:
+        return
+
+    query = request.GET.copy()
+    query["after"] = encode_cursor(list(keys[limit - 1]))
+    query["limit"] = limit
+    url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    response["Link"] = f'<{url}>; rel="next"'
+
+
+async def akeyset_queryset(
+    request, response, queryset, params, ordering=("name", "id")
+):
+    """Narrow ``queryset`` to one page ordered on ``ordering``, starting
+    after ``params.after``, by reading just the sort keys of the page. A
+    ``Link: <...>; rel="next"`` header is added to ``response`` when there
+    are more rows. ``ordering`` must end with the primary key.
+    """
+    page, limit = _page_queryset(queryset, params, ordering)
+    keys = [key async for key in page.values_list(*ordering)]
+    _set_next_link(request, response, keys, limit)
+
+    ids = [key[-1] for key in keys[:limit]]
+    return queryset.filter(pk__in=ids).order_by(*ordering)
+
+
+def keyset_page(queryset, after, limit, ordering):
+    """Sync variant for HTML views. Returns the objects of the page of
+    ``queryset`` following the ``after`` cursor, and the cursor of the page
+    after that or None. ``ordering`` must end with the primary key.
+    """
+    params = CursorParams(after=after, limit=limit)
+    page, limit = _page_queryset(queryset, params, ordering)
+    objs = list(page)
+    if len(objs) <= limit:
+        return objs, None
+
+    last = objs[limit - 1]
+    return objs[:limit], encode_cursor([getattr(last, name) for name in ordering])
@@ -0,0 +1,212 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from inspect import getattr_static
+
+import orjson
+from django.db.models import ForeignObjectRel
+
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+from api_optimize import model_attribute, nested_schema
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Renders with orjson. Anything orjson doesn't produce the same way
+    as Ninja's default encoder (datetimes, Decimals, ...) is handed back to
+    that encoder, so the output matches the JSONRenderer's.
+    """
+
+    media_type = "application/json"
+    encoder = NinjaJSONEncoder()
+
+    def render(self, request, data, *, response_status):
+        return orjson.dumps(
+            data, default=self.encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
+
+renderer = FastJSONRenderer()
+
+
+class _Row(dict):
+    # Lets resolve_* methods read column values as attributes
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    columns: tuple  # values_list() names, primary key first
+    steps: tuple  # (kind, output name, arguments) in schema field order
+    many: tuple  # (output name, related model, lookup, CompiledSchema)
+    one: tuple  # (output name, column index, related model, CompiledSchema)
+
+
+@lru_cache(maxsize=None)
+def compile_schema(model, schema, fields=None):
+    """Compile ``schema`` (or only its ``fields``) for ``model`` into the
+    columns to fetch with values_list() and the steps turning each row
+    into the same dict the schema would produce.
+
+    Only static resolve_* methods are supported. They are called with the
+    row's columns available as attributes.
+    """
+    columns = [model._meta.pk.attname]
+    steps = []
+    many = []
+    one = []
+
+    for name, info in schema.model_fields.items():
+        if fields is not None and name not in fields:
+            continue
+
+        resolver = getattr_static(schema, f"resolve_{name}", None)
+        if resolver is not None:
+            if not isinstance(resolver, staticmethod):
+                raise TypeError(f"{schema.__name__}.resolve_{name} isn't static")
+            steps.append(("resolve", name, resolver.__func__))
+            continue
+
+        attr = info.alias or name
+        field = model_attribute(model, attr)
+        if field is None:
+            raise TypeError(f"{schema.__name__}.{name} isn't a {model.__name__} field")
+
+        nested = nested_schema(info.annotation)
+        if nested is None and not field.many_to_many and not field.one_to_many:
+            if attr not in columns:
+                columns.append(attr)
+            steps.append(("column", name, columns.index(attr)))
+        elif nested is None:
+            raise TypeError(f"{schema.__name__}.{name} needs a nested schema")
+        elif field.many_to_many or field.one_to_many:
+            if isinstance(field, ForeignObjectRel):
+                lookup = field.field.name
+            else:
+                lookup = field.related_query_name()
+
+            compiled = compile_schema(field.related_model, nested)
+            many.append((name, field.related_model, lookup, compiled))
+            steps.append(("many", name, None))
+        elif not isinstance(field, ForeignObjectRel):
+            columns.append(field.attname)
+            compiled = compile_schema(field.related_model, nested)
+            one.append((name, len(columns) - 1, field.related_model, compiled))
+            steps.append(("one", name, len(columns) - 1))
+        else:
+            raise TypeError(
+                f"Can't compile reverse one-to-one {schema.__name__}.{name}"
+            )
+
+    return CompiledSchema(tuple(columns), tuple(steps), tuple(many), tuple(one))
+
+
+def _columns(compiled, key):
+    # The values_list() names, and where the schema's columns start in a row
+    if key is None:
+        return compiled.columns, 0
+    return (key, *compiled.columns), 1
+
+
+def _related(compiled, rows, shift):
+    # (output name, nested CompiledSchema, queryset, grouping key) of each
+    # relation, the key is None for forward relations
+    pks = [row[shift] for row in rows]
+    for name, model, lookup, nested in compiled.many:
+        children = model._default_manager.filter(**{f"{lookup}__in": pks})
+        yield name, nested, children, lookup
+
+    for name, index, model, nested in compiled.one:
+        ids = {row[index + shift] for row in rows} - {None}
+        yield name, nested, model._default_manager.filter(pk__in=ids), None
+
+
+def _group(pairs, key):
+    if key is None:
+        return dict(pairs)
+
+    groups = defaultdict(list)
+    for parent, item in pairs:
+        groups[parent].append(item)
+    return groups
+
+
+def _build(compiled, rows, shift, related):
+    results = []
+    for row in rows:
+        values = row[shift:]
+        item = {}
+        for kind, name, arg in compiled.steps:
+            if kind == "column":
+                item[name] = values[arg]
+            elif kind == "many":
+                item[name] = related[name].get(values[0], [])
+            elif kind == "one":
+                item[name] = related[name].get(values[arg])
+            else:
+                item[name] = arg(_Row(zip(compiled.columns, values)))
+
+        results.append((row[0], item))
+
+    return results
+
+
+def _load(compiled, queryset, key=None):
+    # Returns (key value, dict) pairs, key defaults to the primary key
+    names, shift = _columns(compiled, key)
+    rows = list(queryset.values_list(*names))
+
+    related = {}
+    for name, nested, children, lookup in _related(compiled, rows, shift):
+        related[name] = _group(_load(nested, children, lookup), lookup)
+
+    return _build(compiled, rows, shift, related)
+
+
+async def _aload(compiled, queryset, key=None):
+    # _load() with the async ORM, only the queries leave the event loop
+    names, shift = _columns(compiled, key)
+    rows = [row async for row in queryset.values_list(*names)]
+
+    related = {}
+    for name, nested, children, lookup in _related(compiled, rows, shift):
+        related[name] = _group(await _aload(nested, children, lookup), lookup)
+
+    return _build(compiled, rows, shift, related)
+
+
+def serialize(queryset, schema, fields=None):
+    """Serialize ``queryset`` with ``schema`` straight from values_list()
+    rows, skipping per-object model instances and Pydantic validation.
+    Only use this for trusted ORM output.
+    """
+    compiled = compile_schema(queryset.model, schema, fields)
+    return [item for _, item in _load(compiled, queryset)]
+
+
+async def aserialize(queryset, schema, fields=None):
+    """serialize() with the async ORM."""
+    compiled = compile_schema(queryset.model, schema, fields)
+    return [item for _, item in await _aload(compiled, queryset)]
+
+
+async def aserialize_in_bulk(queryset, schema, pks, fields=None):
+    """Like aserialize(), for the rows of ``queryset`` with a primary key
+    in ``pks``. Returns a dict mapping primary keys to serialized rows.
+    """
+    compiled = compile_schema(queryset.model, schema, fields)
+    return dict(await _aload(compiled, queryset.filter(pk__in=pks)))
+
+
+async def fast_response(response, queryset, schema, fields=None):
+    """Render ``queryset`` into the operation's temporal ``response`` using
+    the compiled serializer, which Ninja then returns as is.
+    """
+    data = await aserialize(queryset, schema, fields)
+    response.content = renderer.render(None, data, response_status=200)
+    return response
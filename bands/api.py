@@ -1,18 +1,43 @@
+from functools import lru_cache
 from typing import Optional
 
-from django.shortcuts import get_object_or_404
+import pydantic
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
 from django.urls import reverse
-from django.utils.text import slugify
 
-from ninja import Field, Router, ModelSchema, FilterSchema, Query
+from ninja import Field, Router, ModelSchema, FilterSchema, Query, Schema
+from ninja.decorators import decorate_view
 
-from api_auth import api_key
+from api_auth import api_key, read_key
+from api_batch import batch_response, parse_ids
+from api_caching import cached_response, versioned_etag
+from api_export import ndjson_response
+from api_fields import parse_fields, sparse_response
+from api_optimize import optimize
+from api_serializers import fast_response
+from api_pagination import CursorParams, akeyset_queryset
+from throttling import TokenBucketThrottle
 
+from bands.bulk import bulk_create, bulk_update
 from bands.models import Venue, Room, Musician, Band
 
 router = Router()
 
 
+@lru_cache(maxsize=None)
+def _url_parts(url_name):
+    # Reverse each route once and splice ids into the result, rather
+    # than calling reverse() for every row of a list response
+    head, _, tail = reverse(url_name, args=[0]).rpartition("0")
+    return head, tail
+
+
+def _url(url_name, obj_id):
+    head, tail = _url_parts(url_name)
+    return f"{head}{obj_id}{tail}"
+
+
 class RoomSchema(ModelSchema):
     class Meta:
         model = Room
@@ -26,45 +51,31 @@ class MusicianSchema(ModelSchema):
 
 
 class BandOut(ModelSchema):
-    slug: str
     url: str
 
     musicians: list[MusicianSchema] = Field(..., alias="musicians")
 
     class Meta:
         model = Band
-        fields = ["name"]
-
-    @staticmethod
-    def resolve_slug(obj):
-        slug = slugify(obj.name) + "-" + str(obj.id)
-        return slug
+        fields = ["name", "slug"]
 
     @staticmethod
     def resolve_url(obj):
-        url = reverse("api-1.0:fetch_band", args=[obj.id])
-        return url
+        return _url("api-1.0:fetch_band", obj.id)
 
 
 class VenueOut(ModelSchema):
-    slug: str
     url: str
 
     rooms: list[RoomSchema] = Field(..., alias="room_set")
 
     class Meta:
         model = Venue
-        fields = ["id", "name", "description"]
-
-    @staticmethod
-    def resolve_slug(obj):
-        slug = slugify(obj.name) + "-" + str(obj.id)
-        return slug
+        fields = ["id", "name", "description", "slug"]
 
     @staticmethod
     def resolve_url(obj):
-        url = reverse("api-1.0:fetch_venue", args=[obj.id])
-        return url
+        return _url("api-1.0:fetch_venue", obj.id)
 
 
 class VenueIn(ModelSchema):
@@ -83,21 +94,117 @@ class MusicianIn(ModelSchema):
         fields = ["first_name", "last_name", "birth", "description"]
 
 
+class VenueUpdate(VenueIn):
+    id: int
+
+
+class MusicianUpdate(MusicianIn):
+    id: int
+
+
+class RoomIn(ModelSchema):
+    class Meta:
+        model = Room
+        fields = ["name", "venue"]
+
+
+class RoomOut(ModelSchema):
+    class Meta:
+        model = Room
+        fields = ["id", "name", "venue"]
+
+
+class MusicianOut(ModelSchema):
+    class Meta:
+        model = Musician
+        fields = ["id", "first_name", "last_name", "birth", "description"]
+
+
+class RoomUpdate(RoomIn):
+    id: int
+
+
+class BulkResult(Schema):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
 class BandFilter(FilterSchema):
     name: Optional[str] = Field(None, q=["name__istartswith"])
 
 
+class VenueBatch(Schema):
+    results: list[VenueOut]
+    missing: list[int]
+
+
+class BandBatch(Schema):
+    results: list[BandOut]
+    missing: list[int]
+
+
+class MusicianBatch(Schema):
+    results: list[MusicianOut]
+    missing: list[int]
+
+
 @router.get("/venue/{venue_id}/", response=VenueOut, url_name="fetch_venue")
-def fetch_venue(request, venue_id):
-    venue = get_object_or_404(Venue, id=venue_id)
+@decorate_view(versioned_etag(Venue, Room))
+@decorate_view(cached_response(objects={"venue_id": Venue}))
+async def fetch_venue(
+    request, response: HttpResponse, venue_id: int, fields: Optional[str] = None
+):
+    fields = parse_fields(VenueOut, fields)
+    venues = optimize(Venue.objects.all(), VenueOut, fields=fields)
+    venue = await aget_object_or_404(venues, id=venue_id)
+    if fields:
+        return sparse_response(response, venue, VenueOut, fields)
+    return venue
+
+
+@router.get("/venue/slug/{slug}/", response=VenueOut, url_name="fetch_venue_by_slug")
+@decorate_view(versioned_etag(Venue, Room))
+async def fetch_venue_by_slug(
+    request, response: HttpResponse, slug: str, fields: Optional[str] = None
+):
+    fields = parse_fields(VenueOut, fields)
+    venues = optimize(Venue.objects.all(), VenueOut, fields=fields)
+    venue = await aget_object_or_404(venues, slug=slug)
+    if fields:
+        return sparse_response(response, venue, VenueOut, fields)
     return venue
 
 
-@router.get("/venues/", response=list[VenueOut])
-def venues(request, filters: VenueFilter = Query(...)):
-    venues = Venue.objects.all()
-    venues = filters.filter(venues)
-    return venues
+@router.get(
+    "/venues/", response=list[VenueOut], throttle=TokenBucketThrottle("api-list")
+)
+@decorate_view(versioned_etag(Venue, Room))
+async def venues(
+    request,
+    response: HttpResponse,
+    filters: VenueFilter = Query(...),
+    page: CursorParams = Query(...),
+    fields: Optional[str] = None,
+):
+    fields = parse_fields(VenueOut, fields)
+    venues = filters.filter(Venue.objects.all())
+    if page.enabled:
+        venues = await akeyset_queryset(request, response, venues, page)
+    return await fast_response(response, venues, VenueOut, fields)
+
+
+@router.get(
+    "/venues/batch/", response=VenueBatch, throttle=TokenBucketThrottle("api-list")
+)
+@decorate_view(versioned_etag(Venue, Room))
+async def fetch_venues(
+    request, response: HttpResponse, ids: str, fields: Optional[str] = None
+):
+    fields = parse_fields(VenueOut, fields)
+    return await batch_response(
+        response, Venue.objects.all(), VenueOut, parse_ids(ids), fields
+    )
 
 
 @router.post("/venue/", response=VenueOut, auth=api_key)
@@ -124,6 +231,122 @@ def update_musician(request, musician_id, payload: MusicianIn):
     return musician
 
 
+def _parse_items(schema, payload):
+    # Validate each item on its own so that one bad item is reported in
+    # its result rather than rejecting the whole batch
+    for index, data in enumerate(payload):
+        try:
+            yield index, schema.model_validate(data), None
+        except pydantic.ValidationError as e:
+            error = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                for err in e.errors()
+            )
+            yield index, None, error
+
+
+def _create_items(schema, payload):
+    return [
+        (index, item.dict(by_alias=True, exclude_unset=True) if item else {}, error)
+        for index, item, error in _parse_items(schema, payload)
+    ]
+
+
+def _update_items(schema, payload):
+    items = []
+    for index, item, error in _parse_items(schema, payload):
+        if item is None:
+            items.append((index, None, {}, error))
+        else:
+            attrs = item.dict(by_alias=True, exclude={"id"}, exclude_unset=True)
+            items.append((index, item.id, attrs, None))
+
+    return items
+
+
+@router.post(
+    "/venues/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_create_venues(request, payload: list[dict]):
+    items = _create_items(VenueIn, payload)
+    return bulk_create(Venue, items)
+
+
+@router.put(
+    "/venues/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_update_venues(request, payload: list[dict]):
+    items = _update_items(VenueUpdate, payload)
+    return bulk_update(Venue, items, ["name", "description"])
+
+
+@router.post(
+    "/musicians/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_create_musicians(request, payload: list[dict]):
+    items = _create_items(MusicianIn, payload)
+    return bulk_create(Musician, items)
+
+
+@router.put(
+    "/musicians/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_update_musicians(request, payload: list[dict]):
+    items = _update_items(MusicianUpdate, payload)
+    fields = ["first_name", "last_name", "birth", "description"]
+    return bulk_update(Musician, items, fields)
+
+
+def _check_room_venues(items):
+    # Check every referenced venue with one query instead of letting
+    # model validation look each one up
+    venue_ids = {attrs.get("venue_id") for *_, attrs, _ in items}
+    found = set(Venue.objects.filter(id__in=venue_ids).values_list("id", flat=True))
+
+    checked = []
+    for *head, attrs, error in items:
+        venue_id = attrs.get("venue_id")
+        if not error and venue_id is not None and venue_id not in found:
+            error = f"venue_id: Venue {venue_id} does not exist"
+        checked.append((*head, attrs, error))
+
+    return checked
+
+
+@router.post(
+    "/rooms/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_create_rooms(request, payload: list[dict]):
+    items = _check_room_venues(_create_items(RoomIn, payload))
+    return bulk_create(Room, items, exclude=["venue"])
+
+
+@router.put(
+    "/rooms/bulk/",
+    response=list[BulkResult],
+    auth=api_key,
+    throttle=TokenBucketThrottle("api-bulk"),
+)
+def bulk_update_rooms(request, payload: list[dict]):
+    items = _check_room_venues(_update_items(RoomUpdate, payload))
+    return bulk_update(Room, items, ["name", "venue"], exclude=["venue"])
+
+
 @router.delete("/venue/{venue_id}/", auth=api_key)
 def delete_venue(request, venue_id):
     venue = get_object_or_404(Venue, id=venue_id)
@@ -133,13 +356,101 @@ def delete_venue(request, venue_id):
 
 
 @router.get("/band/{band_id}", response=BandOut, url_name="fetch_band")
-def bands(request, band_id):
-    bands = get_object_or_404(Band, id=band_id)
-    return bands
-
-
-@router.get("/bands/", response=list[BandOut])
-def bands(request, filters: BandFilter = Query(...)):
-    bands = Band.objects.all()
-    bands = filters.filter(bands)
-    return bands
+@decorate_view(versioned_etag(Band, Musician))
+@decorate_view(cached_response(objects={"band_id": Band}))
+async def bands(
+    request, response: HttpResponse, band_id: int, fields: Optional[str] = None
+):
+    fields = parse_fields(BandOut, fields)
+    bands = optimize(Band.objects.all(), BandOut, fields=fields)
+    band = await aget_object_or_404(bands, id=band_id)
+    if fields:
+        return sparse_response(response, band, BandOut, fields)
+    return band
+
+
+@router.get("/band/slug/{slug}", response=BandOut, url_name="fetch_band_by_slug")
+@decorate_view(versioned_etag(Band, Musician))
+async def fetch_band_by_slug(
+    request, response: HttpResponse, slug: str, fields: Optional[str] = None
+):
+    fields = parse_fields(BandOut, fields)
+    bands = optimize(Band.objects.all(), BandOut, fields=fields)
+    band = await aget_object_or_404(bands, slug=slug)
+    if fields:
+        return sparse_response(response, band, BandOut, fields)
+    return band
+
+
+@router.get("/bands/", response=list[BandOut], throttle=TokenBucketThrottle("api-list"))
+@decorate_view(versioned_etag(Band, Musician))
+async def bands(
+    request,
+    response: HttpResponse,
+    filters: BandFilter = Query(...),
+    page: CursorParams = Query(...),
+    fields: Optional[str] = None,
+):
+    fields = parse_fields(BandOut, fields)
+    bands = filters.filter(Band.objects.all())
+    if page.enabled:
+        bands = await akeyset_queryset(request, response, bands, page)
+    return await fast_response(response, bands, BandOut, fields)
+
+
+@router.get(
+    "/bands/batch/", response=BandBatch, throttle=TokenBucketThrottle("api-list")
+)
+@decorate_view(versioned_etag(Band, Musician))
+async def fetch_bands(
+    request, response: HttpResponse, ids: str, fields: Optional[str] = None
+):
+    fields = parse_fields(BandOut, fields)
+    return await batch_response(
+        response, Band.objects.all(), BandOut, parse_ids(ids), fields
+    )
+
+
+@router.get(
+    "/musicians/batch/",
+    response=MusicianBatch,
+    throttle=TokenBucketThrottle("api-list"),
+)
+@decorate_view(versioned_etag(Musician))
+async def fetch_musicians(
+    request, response: HttpResponse, ids: str, fields: Optional[str] = None
+):
+    fields = parse_fields(MusicianOut, fields)
+    return await batch_response(
+        response, Musician.objects.all(), MusicianOut, parse_ids(ids), fields
+    )
+
+
+@router.get(
+    "/musicians/export.ndjson",
+    auth=read_key,
+    throttle=TokenBucketThrottle("api-export"),
+)
+async def export_musicians(request):
+    return ndjson_response(request, Musician.objects.all(), MusicianOut)
+
+
+@router.get(
+    "/bands/export.ndjson", auth=read_key, throttle=TokenBucketThrottle("api-export")
+)
+async def export_bands(request):
+    return ndjson_response(request, Band.objects.all(), BandOut)
+
+
+@router.get(
+    "/venues/export.ndjson", auth=read_key, throttle=TokenBucketThrottle("api-export")
+)
+async def export_venues(request):
+    return ndjson_response(request, Venue.objects.all(), VenueOut)
+
+
+@router.get(
+    "/rooms/export.ndjson", auth=read_key, throttle=TokenBucketThrottle("api-export")
+)
+async def export_rooms(request):
+    return ndjson_response(request, Room.objects.all(), RoomOut)
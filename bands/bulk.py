@@ -0,0 +1,121 @@
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+from bands.models import SluggedModel, bump_versions
+from bands.paginator import adjust_count
+
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start : start + CHUNK_SIZE]
+
+
+def _validation_error(obj, exclude):
+    # Field and model validation only: validate_unique() and foreign key
+    # checks would cost a query per object
+    try:
+        obj.clean_fields(exclude=exclude)
+        obj.clean()
+    except ValidationError as e:
+        return "; ".join(
+            f"{field}: {' '.join(messages)}"
+            for field, messages in e.message_dict.items()
+        )
+
+    return None
+
+
+def bulk_create(model, items, exclude=()):
+    """Create ``model`` rows from ``items``, a list of (index, attrs, error)
+    tuples, in chunked transactions. Items that already carry an error are
+    skipped. Returns one result dict per item.
+    """
+    results = []
+    for chunk in _chunks(items):
+        objs = []
+        for index, attrs, error in chunk:
+            if error:
+                results.append({"index": index, "error": error})
+                continue
+
+            obj = model(**attrs)
+            error = _validation_error(obj, exclude)
+            if error:
+                results.append({"index": index, "error": error})
+            else:
+                objs.append((index, obj))
+
+        if not objs:
+            continue
+
+        try:
+            with transaction.atomic():
+                created = model.objects.bulk_create([obj for _, obj in objs])
+                if issubclass(model, SluggedModel):
+                    # bulk_create() skips save(), fill the slugs in now that
+                    # the rows have ids
+                    for obj in created:
+                        obj.slug = obj.build_slug()
+                    model.objects.bulk_update(created, ["slug"])
+        except DatabaseError as e:
+            results.extend({"index": index, "error": str(e)} for index, _ in objs)
+            continue
+
+        results.extend({"index": index, "id": obj.id} for index, obj in objs)
+        # bulk_create() doesn't send post_save
+        bump_versions(model, [obj for _, obj in objs])
+        adjust_count(model, len(objs))
+
+    return sorted(results, key=lambda result: result["index"])
+
+
+def bulk_update(model, items, fields, exclude=()):
+    """Update existing ``model`` rows from ``items``, a list of
+    (index, id, attrs, error) tuples, in chunked transactions. Each chunk
+    loads its rows with a single query. Returns one result dict per item.
+    """
+    if issubclass(model, SluggedModel):
+        fields = [*fields, "slug"]
+
+    results = []
+    for chunk in _chunks(items):
+        ids = [obj_id for _, obj_id, _, _ in chunk if obj_id is not None]
+        existing = model.objects.in_bulk(ids)
+
+        objs = []
+        for index, obj_id, attrs, error in chunk:
+            obj = existing.get(obj_id)
+            if obj is None and not error:
+                error = f"{model.__name__} {obj_id} does not exist"
+
+            if not error:
+                for key, val in attrs.items():
+                    setattr(obj, key, val)
+                error = _validation_error(obj, exclude)
+
+            if error:
+                results.append({"index": index, "id": obj_id, "error": error})
+            else:
+                if isinstance(obj, SluggedModel):
+                    obj.slug = obj.build_slug()
+                objs.append((index, obj))
+
+        if not objs:
+            continue
+
+        try:
+            with transaction.atomic():
+                model.objects.bulk_update([obj for _, obj in objs], fields)
+        except DatabaseError as e:
+            results.extend(
+                {"index": index, "id": obj.id, "error": str(e)} for index, obj in objs
+            )
+            continue
+
+        results.extend({"index": index, "id": obj.id} for index, obj in objs)
+        # bulk_update() doesn't send post_save
+        bump_versions(model, [obj for _, obj in objs])
+
+    return sorted(results, key=lambda result: result["index"])
@@ -1,10 +1,73 @@
 from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
 from bands.models import Venue, Musician, Room
 
-VenueForm = forms.modelform_factory(Venue, fields=["name", "description", "picture"])
+
+class BoundedImageField(forms.ImageField):
+    """ImageField rejecting pictures over settings.PICTURE_MAX_BYTES or
+    settings.PICTURE_MAX_PIXELS, and formats other than FORMATS. Only the
+    image header is read, the pixels are never decoded in the request.
+    Scaling down and stripping metadata happens in bands.images after the
+    picture is saved.
+    """
+
+    FORMATS = ("GIF", "JPEG", "PNG", "WEBP")
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return None
+
+        if data.size > settings.PICTURE_MAX_BYTES:
+            raise ValidationError(
+                "Pictures can be at most %(limit)s.",
+                code="file_too_big",
+                params={"limit": filesizeformat(settings.PICTURE_MAX_BYTES)},
+            )
+
+        # Opening only parses the header
+        try:
+            with Image.open(data) as image:
+                width, height = image.size
+                kind = image.format
+        except Image.DecompressionBombError:
+            width = height = settings.PICTURE_MAX_PIXELS
+            kind = None
+        except Exception as error:
+            raise ValidationError(
+                self.error_messages["invalid_image"], code="invalid_image"
+            ) from error
+        finally:
+            data.seek(0)
+
+        if width * height > settings.PICTURE_MAX_PIXELS:
+            raise ValidationError(
+                "Pictures can be at most %(limit)s megapixels.",
+                code="too_many_pixels",
+                params={"limit": settings.PICTURE_MAX_PIXELS // 1_000_000},
+            )
+        if kind not in self.FORMATS:
+            raise ValidationError(
+                "Pictures must be GIF, JPEG, PNG or WebP images.",
+                code="invalid_format",
+            )
+
+        return super().to_python(data)
+
+
+VenueForm = forms.modelform_factory(
+    Venue,
+    fields=["name", "description", "picture"],
+    field_classes={"picture": BoundedImageField},
+)
 
 MusicianForm = forms.modelform_factory(
-    Musician, fields=["first_name", "last_name", "birth", "description", "picture"]
+    Musician,
+    fields=["first_name", "last_name", "birth", "description", "picture"],
+    field_classes={"picture": BoundedImageField},
 )
 
 
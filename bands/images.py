@@ -0,0 +1,205 @@
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import PurePosixPath
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+# Scaled down copies of the musician and venue pictures, so pages don't
+# send the uploaded originals. Each picture gets a WebP and a JPEG copy at
+# each of WIDTHS, stored next to it as <name>.<width>w.<ext>. They're
+# written by a thread pool once the transaction saving the picture
+# commits, Pillow releases the GIL while it decodes, resizes and encodes.
+#
+# Before that the same job replaces originals that are bigger than
+# settings.PICTURE_MAX_SIDE, or carry EXIF metadata, with a scaled down
+# copy without it. The copy is written under a new name and the rows are
+# pointed at it before the original is deleted, so the original is served
+# until then. Uploads are only checked in the request, see
+# bands.forms.BoundedImageField.
+#
+# The rows then record the name of the picture that was processed, so
+# pages only offer derivatives that were written, without asking the
+# storage. Jobs only live in memory, the make_thumbnails command processes
+# the pictures whose rows don't record them yet, e.g. after a restart.
+
+logger = logging.getLogger(__name__)
+
+# Decoding anything bigger raises DecompressionBombError
+Image.MAX_IMAGE_PIXELS = settings.PICTURE_MAX_PIXELS
+
+WIDTHS = (80, 160, 320, 640)
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+QUALITY = 80
+WORKERS = 2
+
+DERIVATIVE = re.compile(r"\.\d+w\.(?:webp|jpg)$")
+
+_executor = ThreadPoolExecutor(WORKERS, thread_name_prefix="thumbnails")
+_lock = Lock()
+_pending = set()
+
+
+def derivative_name(name, width, ext):
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{width}w.{ext}"))
+
+
+def is_derivative(name):
+    return bool(DERIVATIVE.search(name))
+
+
+def derivative_names(name):
+    return [derivative_name(name, width, ext) for ext in FORMATS for width in WIDTHS]
+
+
+def normalize_picture(name, storage=default_storage):
+    """Write a copy of picture ``name`` scaled down to fit
+    settings.PICTURE_MAX_SIDE and stripped of EXIF metadata, if it needs
+    either. Returns the name of the copy, or None. The original is left
+    alone.
+    """
+    limit = settings.PICTURE_MAX_SIDE
+    with storage.open(name) as f:
+        image = Image.open(f)
+        kind = image.format
+        # Animations would lose all but their first frame
+        if getattr(image, "n_frames", 1) > 1:
+            return None
+        if max(image.size) <= limit and not image.getexif():
+            return None
+
+        image.draft("RGB", (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+
+    buffer = BytesIO()
+    if kind == "JPEG":
+        image.save(buffer, kind, quality=90, optimize=True)
+    else:
+        image.save(buffer, kind)
+
+    # The original still exists, so save() picks a new name
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_thumbnails(name, force=False, storage=default_storage):
+    """Write the derivatives of picture ``name``, returns how many were
+    written. Pictures whose derivatives exist are skipped unless ``force``.
+    """
+    names = derivative_names(name)
+    if not force and storage.exists(names[-1]):
+        return 0
+
+    with storage.open(name) as f:
+        image = Image.open(f)
+        # Decoding straight to about the largest size needed is much
+        # cheaper for big JPEGs
+        image.draft("RGB", (WIDTHS[-1], WIDTHS[-1] * image.height // image.width))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ("RGB", "RGBA"):
+        alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if alpha else "RGB")
+
+    written = 0
+    # Largest first, each size is scaled down from the one before
+    for width in reversed(WIDTHS):
+        # Smaller pictures are copied at their own size, so every
+        # derivative exists for srcset
+        if width < image.width:
+            image = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            )
+        for ext, kind in FORMATS.items():
+            out = image.convert("RGB") if kind == "JPEG" else image
+            buffer = BytesIO()
+            out.save(buffer, kind, quality=QUALITY, optimize=True)
+            derivative = derivative_name(name, width, ext)
+            # save() would pick a new name for an existing file
+            storage.delete(derivative)
+            storage.save(derivative, ContentFile(buffer.getvalue()))
+            written += 1
+
+    return written
+
+
+def delete_picture(name, storage=default_storage):
+    """Delete picture ``name`` and its derivatives."""
+    for path in [name, *derivative_names(name)]:
+        storage.delete(path)
+
+
+def process_picture(name, record, force=False, storage=default_storage):
+    """Normalize picture ``name`` and make its derivatives, returns how
+    many were written. ``record(name, new_name)`` then points the rows
+    using the picture at ``new_name`` and records it as processed,
+    returning whether any rows changed.
+    """
+    new_name = normalize_picture(name, storage)
+    if new_name is None:
+        written = make_thumbnails(name, force, storage)
+        record(name, name)
+        return written
+
+    # The copy is complete before anything refers to it
+    try:
+        written = make_thumbnails(new_name, True, storage)
+        renamed = record(name, new_name)
+    except Exception:
+        delete_picture(new_name, storage)
+        raise
+    if not renamed:
+        # The rows moved on to another picture in between
+        delete_picture(new_name, storage)
+        return 0
+
+    delete_picture(name, storage)
+    return written
+
+
+def _process_picture(name, record):
+    try:
+        process_picture(name, record)
+    except Exception:
+        logger.exception("Processing picture %s failed", name)
+
+
+def schedule_thumbnails(name, record):
+    """Process picture ``name`` in the thread pool once the current
+    transaction commits, see process_picture().
+    """
+
+    def submit():
+        future = _executor.submit(_process_picture, name, record)
+        with _lock:
+            _pending.add(future)
+        future.add_done_callback(_discard)
+
+    transaction.on_commit(submit)
+
+
+def _discard(future):
+    with _lock:
+        _pending.discard(future)
+
+
+def wait_for_thumbnails():
+    """Block until all scheduled derivatives are written."""
+    with _lock:
+        pending = set(_pending)
+    wait(pending)
+
+
+def srcset(name, ext, storage=default_storage):
+    return ", ".join(
+        f"{storage.url(derivative_name(name, width, ext))} {width}w" for width in WIDTHS
+    )
@@ -0,0 +1,146 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+from ninja import NinjaAPI, Router
+from ninja.decorators import decorate_view
+
+from RiffMates import urls
+from api_caching import cached_response, versioned_etag
+from api_optimize import optimize
+from api_serializers import FastJSONRenderer, renderer, serialize
+from bands.api import BandOut, VenueOut
+from bands.models import Band, Musician, Room, Venue
+from promoters.api import PromoterSchema
+from promoters.models import Promoter
+
+# The read endpoints as they were before they were made async, served
+# through the WSGI handler as the baseline. They serialize and cache the
+# same way as the async views, so only sync vs async differs.
+
+sync_router = Router()
+
+
+@sync_router.get("/bands/bands/", response=list[BandOut])
+@decorate_view(versioned_etag(Band, Musician))
+def bands(request, response: HttpResponse):
+    data = serialize(Band.objects.all(), BandOut)
+    response.content = renderer.render(None, data, response_status=200)
+    return response
+
+
+@sync_router.get("/bands/venues/", response=list[VenueOut])
+@decorate_view(versioned_etag(Venue, Room))
+def venues(request, response: HttpResponse):
+    data = serialize(Venue.objects.all(), VenueOut)
+    response.content = renderer.render(None, data, response_status=200)
+    return response
+
+
+@sync_router.get("/promoters/promoters/", response=list[PromoterSchema])
+@decorate_view(cached_response(Promoter))
+def promoters(request):
+    return list(optimize(Promoter.objects.all(), PromoterSchema))
+
+
+sync_api = NinjaAPI(renderer=FastJSONRenderer(), urls_namespace="bench-sync")
+sync_api.add_router("/", sync_router)
+
+# Used as ROOT_URLCONF while benchmarking, the sync versions are served
+# under SYNC_PREFIX instead of /api/v1/
+SYNC_PREFIX = "/bench-sync/"
+urlpatterns = [path(SYNC_PREFIX[1:], sync_api.urls), *urls.urlpatterns]
+
+PATHS = [
+    "/api/v1/bands/bands/",
+    "/api/v1/bands/venues/",
+    "/api/v1/promoters/promoters/",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare API read throughput of the async views served through the "
+        "ASGI handler (one event loop) with sync versions of them served "
+        "through the WSGI handler (a pool of worker threads)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            "-n",
+            type=int,
+            default=200,
+            help="Number of requests to send to each path.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            "-c",
+            type=int,
+            default=20,
+            help="Requests in flight at once (and WSGI thread pool size).",
+        )
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help=f"API paths to request, any of {', '.join(PATHS)}. Defaults to all.",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or PATHS
+        unknown = set(paths) - set(PATHS)
+        if unknown:
+            raise CommandError(f"No sync version of {', '.join(sorted(unknown))}.")
+        count = options["requests"]
+        concurrency = options["concurrency"]
+
+        # The test clients send requests for the "testserver" host, and
+        # the benchmark shouldn't be throttled
+        with override_settings(
+            ALLOWED_HOSTS=["testserver"], THROTTLE_RATES={}, ROOT_URLCONF=__name__
+        ):
+            for path in paths:
+                self.stdout.write(path)
+                sync_path = SYNC_PREFIX + path.removeprefix("/api/v1/")
+                elapsed = self._bench_wsgi(sync_path, count, concurrency)
+                self._report("WSGI sync", count, elapsed)
+                elapsed = asyncio.run(self._bench_asgi(path, count, concurrency))
+                self._report("ASGI async", count, elapsed)
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(f"   {label}: {count / elapsed:8.1f} req/s ({elapsed:.2f}s)")
+
+    def _bench_wsgi(self, path, count, concurrency):
+        client = Client()
+
+        def fetch(_):
+            return client.get(path).status_code
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            statuses = list(pool.map(fetch, range(count)))
+        self._check(statuses)
+        return perf_counter() - start
+
+    async def _bench_asgi(self, path, count, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with semaphore:
+                response = await client.get(path)
+                return response.status_code
+
+        start = perf_counter()
+        statuses = await asyncio.gather(*(fetch() for _ in range(count)))
+        self._check(statuses)
+        return perf_counter() - start
+
+    def _check(self, statuses):
+        failed = [status for status in statuses if status != 200]
+        if failed:
+            self.stderr.write(f"   {len(failed)} requests failed: {set(failed)}")
@@ -7,6 +7,7 @@ from typing import Iterable, Set
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
+from bands.images import derivative_names
 from bands.models import Musician, Venue
 
 
@@ -156,6 +157,12 @@ class Command(BaseCommand):
                 name = getattr(f, "name", None)
                 if not name:
                     continue
+                # Thumbnails of a referenced picture aren't orphans, but
+                # they may not have been made yet so aren't "missing"
+                for derivative in derivative_names(name):
+                    p = (media_root / derivative).resolve()
+                    if p.exists() and media_root in p.parents:
+                        referenced.add(p)
                 p = (media_root / name).resolve()
                 # Only include files that live under MEDIA_ROOT.
                 if media_root in p.parents or p == media_root:
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
+
+from bands.images import process_picture
+from bands.models import Musician, Venue, record_picture
+
+
+def make(name, force):
+    # Runs in the worker processes, errors are reported per picture
+    try:
+        return process_picture(name, record_picture, force)
+    except Exception as error:
+        return str(error) or type(error).__name__
+
+
+class Command(BaseCommand):
+    help = (
+        "Normalize the musician and venue pictures that weren't processed "
+        "yet and make their thumbnails, e.g. after a restart lost the "
+        "queued jobs. Run it on every deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes resizing pictures, defaults to one per CPU.",
+        )
+
+        parser.add_argument(
+            "--force",
+            "-f",
+            action="store_true",
+            help="Process every picture and remake its thumbnails.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        names = set()
+        for model in (Musician, Venue):
+            pictures = model.objects.exclude(picture="").exclude(picture=None)
+            if not options["force"]:
+                pictures = pictures.exclude(processed_picture=F("picture"))
+            names.update(pictures.values_list("picture", flat=True))
+        names = sorted(names)
+        force = [options["force"]] * len(names)
+
+        if options["workers"] == 1 or len(names) < 2:
+            self._report(names, map(make, names, force))
+            return
+
+        # Connections mustn't be shared with forked workers
+        connections.close_all()
+        with ProcessPoolExecutor(options["workers"], initializer=django.setup) as pool:
+            self._report(names, pool.map(make, names, force))
+
+    def _report(self, names, results):
+        written = 0
+        for name, result in zip(names, results):
+            if isinstance(result, str):
+                self.stderr.write(f"{name}: {result}")
+            else:
+                written += result
+
+        self.stdout.write(f"Wrote {written} thumbnails for {len(names)} pictures")
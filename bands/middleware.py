@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from bands.models import UserProfile
+from versions import get_object_versions
+
+PERMISSIONS_TIMEOUT = 60 * 60
+
+
+@dataclass(frozen=True)
+class Permissions:
+    """IDs of the musicians and venues a user's profile controls."""
+
+    musician_ids: frozenset = frozenset()
+    venue_ids: frozenset = frozenset()
+
+
+ANONYMOUS = Permissions()
+
+
+def get_permissions(user):
+    """The Permissions of ``user``, from the cache when possible. Cached
+    snapshots are keyed on the user's version stamp, which the
+    m2m_changed receivers in bands.models bump. Also remembered on the
+    user object, so checks made while handling one request share it.
+    """
+    if not user.is_authenticated:
+        return ANONYMOUS
+
+    permissions = getattr(user, "_permissions", None)
+    if permissions is not None:
+        return permissions
+
+    (stamp,) = get_object_versions((User, user.pk))
+    key = f"permissions:{user.pk}:{stamp}"
+    permissions = cache.get(key)
+    if permissions is None:
+        musicians = UserProfile.musician_profiles.through.objects.filter(
+            userprofile__user=user
+        )
+        venues = UserProfile.venues_controlled.through.objects.filter(
+            userprofile__user=user
+        )
+        permissions = Permissions(
+            frozenset(musicians.values_list("musician_id", flat=True)),
+            frozenset(venues.values_list("venue_id", flat=True)),
+        )
+        cache.set(key, permissions, timeout=PERMISSIONS_TIMEOUT)
+
+    user._permissions = permissions
+    return permissions
+
+
+class PermissionsMiddleware:
+    """Sets ``request.permissions`` to the user's Permissions, loaded on
+    first use. Must come after AuthenticationMiddleware. Works for sync and
+    async requests, async views must not use ``request.permissions`` as
+    loading it queries the database.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.permissions = SimpleLazyObject(lambda: get_permissions(request.user))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.permissions = SimpleLazyObject(lambda: get_permissions(request.user))
+        return await self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bands', '0007_alter_room_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='band',
+            index=models.Index(fields=['name', 'id'], name='bands_band_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venue',
+            index=models.Index(fields=['name', 'id'], name='bands_venue_name_id_idx'),
+        ),
+    ]
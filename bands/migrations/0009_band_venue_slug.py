@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+BATCH_SIZE = 1000
+
+
+def fill_slugs(apps, schema_editor):
+    for model_name in ["Band", "Venue"]:
+        Model = apps.get_model("bands", model_name)
+        rows = Model.objects.only("id", "name").order_by("id")
+
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            row.slug = slugify(row.name) + "-" + str(row.id)
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                Model.objects.bulk_update(batch, ["slug"])
+                batch = []
+
+        if batch:
+            Model.objects.bulk_update(batch, ["slug"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bands', '0008_band_venue_name_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='band',
+            name='slug',
+            field=models.SlugField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='venue',
+            name='slug',
+            field=models.SlugField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+from django.db import migrations
+
+# A full-text index over musicians, only on SQLite (with FTS5). Other
+# databases fall back to the ORM search in bands/search.py. The index is an
+# external content table: it stores just the index, reads the text from
+# bands_musician, and the triggers keep it in step with every write,
+# including bulk ones.
+
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE bands_musician_fts USING fts5(
+        first_name, last_name, description,
+        content='bands_musician', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Name matches count for more than description matches
+    """
+    INSERT INTO bands_musician_fts(bands_musician_fts, rank)
+    VALUES ('rank', 'bm25(10.0, 10.0, 1.0)')
+    """,
+    """
+    CREATE TRIGGER bands_musician_fts_insert AFTER INSERT ON bands_musician
+    BEGIN
+        INSERT INTO bands_musician_fts(rowid, first_name, last_name, description)
+        VALUES (new.id, new.first_name, new.last_name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER bands_musician_fts_delete AFTER DELETE ON bands_musician
+    BEGIN
+        INSERT INTO bands_musician_fts(
+            bands_musician_fts, rowid, first_name, last_name, description
+        )
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER bands_musician_fts_update
+    AFTER UPDATE OF first_name, last_name, description ON bands_musician
+    BEGIN
+        INSERT INTO bands_musician_fts(
+            bands_musician_fts, rowid, first_name, last_name, description
+        )
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.description);
+        INSERT INTO bands_musician_fts(rowid, first_name, last_name, description)
+        VALUES (new.id, new.first_name, new.last_name, new.description);
+    END
+    """,
+    # Index the musicians already there
+    "INSERT INTO bands_musician_fts(bands_musician_fts) VALUES ('rebuild')",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS bands_musician_fts_insert",
+    "DROP TRIGGER IF EXISTS bands_musician_fts_delete",
+    "DROP TRIGGER IF EXISTS bands_musician_fts_update",
+    "DROP TABLE IF EXISTS bands_musician_fts",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bands", "0009_band_venue_slug"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
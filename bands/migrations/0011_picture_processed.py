@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Adding a NOT NULL column rebuilds bands_musician on SQLite, which drops
+# the triggers keeping the full-text index from 0010 in step
+search = import_module("bands.migrations.0010_musician_search")
+TRIGGERS = [sql for sql in search.CREATE if "CREATE TRIGGER" in sql]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in search.DROP[:3] + TRIGGERS:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bands", "0010_musician_search"),
+    ]
+
+    operations = [
+        # Also when unapplied, removing the column rebuilds the table too
+        migrations.RunPython(migrations.RunPython.noop, create_triggers),
+        migrations.AddField(
+            model_name="musician",
+            name="processed_picture",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="venue",
+            name="processed_picture",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(create_triggers, migrations.RunPython.noop),
+    ]
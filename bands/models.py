@@ -2,8 +2,13 @@
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_login_failed
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils.text import slugify
+
+from bands.images import schedule_thumbnails
+from bands.paginator import adjust_count
+from versions import bump_object_versions, bump_version
 
 
 class Musician(models.Model):
@@ -12,6 +17,8 @@ class Musician(models.Model):
     birth = models.DateField()
     description = models.TextField(blank=True)
     picture = models.ImageField(blank=True, null=True)
+    # The picture whose derivatives bands.images wrote, see record_picture()
+    processed_picture = models.CharField(max_length=100, blank=True, editable=False)
 
     class Meta:
         ordering = ["last_name", "first_name"]
@@ -20,7 +27,34 @@ class Musician(models.Model):
         return f"Musician(id={self.id}, last_name={self.last_name})"
 
 
-class Band(models.Model):
+class SluggedModel(models.Model):
+    # "<slugified name>-<id>", stored so API responses and slug lookups
+    # don't need to compute it for every row
+    slug = models.SlugField(max_length=50, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def build_slug(self):
+        return slugify(self.name) + "-" + str(self.id)
+
+    def save(self, *args, **kwargs):
+        if self.id is None:
+            # The slug includes the id, which only exists after the insert
+            super().save(*args, **kwargs)
+            self.slug = self.build_slug()
+            type(self).objects.filter(id=self.id).update(slug=self.slug)
+            return
+
+        self.slug = self.build_slug()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "slug"}
+
+        super().save(*args, **kwargs)
+
+
+class Band(SluggedModel):
     name = models.CharField(max_length=20)
     musicians = models.ManyToManyField(Musician)
 
@@ -28,20 +62,30 @@ class Band(models.Model):
         ordering = [
             "name",
         ]
+        indexes = [
+            # Keyset pagination in the API orders on (name, id)
+            models.Index(fields=["name", "id"], name="bands_band_name_id_idx"),
+        ]
 
     def __str__(self):
         return f"Band(id={self.id}, name={self.name})"
 
 
-class Venue(models.Model):
+class Venue(SluggedModel):
     name = models.CharField(max_length=20)
     description = models.TextField(blank=True)
     picture = models.ImageField(blank=True, null=True)
+    # The picture whose derivatives bands.images wrote, see record_picture()
+    processed_picture = models.CharField(max_length=100, blank=True, editable=False)
 
     class Meta:
         ordering = [
             "name",
         ]
+        indexes = [
+            # Keyset pagination in the API orders on (name, id)
+            models.Index(fields=["name", "id"], name="bands_venue_name_id_idx"),
+        ]
 
     def __str__(self):
         return f"Venue(id={self.id}, name={self.name})"
@@ -59,6 +103,13 @@ class Room(models.Model):
     def __str__(self):
         return f"Room(id={self.id}, name={self.name})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        room = super().from_db(db, field_names, values)
+        # Kept so moving a room can invalidate the venue it left
+        room.loaded_venue_id = room.__dict__.get("venue_id")
+        return room
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -81,6 +132,126 @@ def user_post_save(sender, **kwargs):
             UserProfile.objects.create(user=user)
 
 
+@receiver(m2m_changed, sender=UserProfile.musician_profiles.through)
+@receiver(m2m_changed, sender=UserProfile.venues_controlled.through)
+def profile_controls_changed(sender, **kwargs):
+    # Drops the cached permission snapshots (bands.middleware) of the
+    # users whose controlled musicians or venues changed
+    action = kwargs["action"]
+    instance = kwargs["instance"]
+    if not kwargs["reverse"]:
+        if action.startswith("post_"):
+            bump_object_versions(User, [instance.user_id])
+    elif action == "pre_clear":
+        # A clear doesn't say which profiles lost the musician or venue
+        rows = sender.objects.filter(**{instance._meta.model_name: instance})
+        user_ids = rows.values_list("userprofile__user_id", flat=True)
+        bump_object_versions(User, set(user_ids))
+    elif action.startswith("post_") and kwargs["pk_set"]:
+        profiles = UserProfile.objects.filter(id__in=kwargs["pk_set"])
+        bump_object_versions(User, set(profiles.values_list("user_id", flat=True)))
+
+
+def bump_versions(model, objs):
+    """Bump the version of ``model`` and the per-object versions of
+    ``objs`` and of the objects whose API output or pages include them.
+    Called by the receivers below and by bulk writes, which don't send
+    signals.
+    """
+    bump_version(model)
+    pks = [obj.pk for obj in objs]
+    bump_object_versions(model, pks)
+
+    if model is Room:
+        venue_ids = {obj.venue_id for obj in objs}
+        venue_ids |= {getattr(obj, "loaded_venue_id", None) for obj in objs}
+        bump_object_versions(Venue, venue_ids - {None})
+    elif model is Musician:
+        memberships = Band.musicians.through.objects.filter(musician_id__in=pks)
+        band_ids = set(memberships.values_list("band_id", flat=True))
+        bump_object_versions(Band, band_ids)
+    elif model is Band:
+        # Musician pages list their bands
+        memberships = Band.musicians.through.objects.filter(band_id__in=pks)
+        musician_ids = set(memberships.values_list("musician_id", flat=True))
+        bump_object_versions(Musician, musician_ids)
+
+
+@receiver(post_save, sender=Musician)
+@receiver(post_save, sender=Band)
+@receiver([post_save, post_delete], sender=Venue)
+@receiver([post_save, post_delete], sender=Room)
+def bump_instance_versions(sender, **kwargs):
+    bump_versions(sender, [kwargs["instance"]])
+
+
+@receiver(post_save, sender=Musician)
+@receiver(post_save, sender=Venue)
+def picture_saved(sender, **kwargs):
+    # Pictures that already have their derivatives are skipped by the
+    # worker, so this doesn't need to know whether the picture changed
+    picture = kwargs["instance"].picture
+    if picture:
+        schedule_thumbnails(picture.name, record_picture)
+
+
+def record_picture(name, new_name):
+    """Point the musicians and venues using picture ``name`` at
+    ``new_name`` and record that its derivatives are written, returns
+    whether any rows changed. Called by bands.images once it processed the
+    picture, ``new_name`` is ``name`` unless it had to be normalized.
+    """
+    recorded = False
+    for model in (Musician, Venue):
+        pictures = model.objects.filter(picture=name)
+        objs = list(pictures.exclude(processed_picture=new_name).only("id"))
+        rows = pictures.filter(pk__in=[obj.pk for obj in objs])
+        # update() keeps picture_saved from scheduling the picture again
+        if rows.update(picture=new_name, processed_picture=new_name):
+            # Cached pages switch to the derivatives
+            bump_versions(model, objs)
+            recorded = True
+
+    return recorded
+
+
+@receiver(post_save, sender=Musician)
+@receiver(post_save, sender=Band)
+@receiver(post_save, sender=Venue)
+def count_created(sender, **kwargs):
+    # Keeps the cached row counts behind the HTML list pages in step
+    if kwargs["created"]:
+        adjust_count(sender, 1)
+
+
+@receiver(post_delete, sender=Musician)
+@receiver(post_delete, sender=Band)
+@receiver(post_delete, sender=Venue)
+def count_deleted(sender, **kwargs):
+    adjust_count(sender, -1)
+
+
+@receiver(pre_delete, sender=Musician)
+@receiver(pre_delete, sender=Band)
+def band_member_pre_delete(sender, **kwargs):
+    # Band memberships are already gone by post_delete
+    bump_versions(sender, [kwargs["instance"]])
+
+
+@receiver(m2m_changed, sender=Band.musicians.through)
+def band_musicians_changed(sender, **kwargs):
+    action = kwargs["action"]
+    instance = kwargs["instance"]
+    if action == "pre_clear":
+        # A clear doesn't say which rows were on the other side
+        bump_versions(type(instance), [instance])
+    elif action.startswith("post_"):
+        bump_version(Band)
+        bump_object_versions(type(instance), [instance.pk])
+        if kwargs["pk_set"]:
+            bump_object_versions(kwargs["model"], kwargs["pk_set"])
+
+
 @receiver(user_login_failed)
 def track_login_failure(sender, **kwargs):
     username = kwargs["credentials"]["username"]
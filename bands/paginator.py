@@ -0,0 +1,76 @@
+from hashlib import sha1
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from versions import get_versions
+
+# Row counts for paginated lists, kept in the shared cache.
+#
+# The count of a whole table is kept up to date by adjust_count(), called
+# from post_save/post_delete receivers and by bulk writes. Counts can drift
+# if a transaction that adjusted one rolls back, so they also expire after
+# COUNT_TIMEOUT. Counts of filtered querysets can't be adjusted, they're
+# keyed on the model's version counter instead, so any write recounts them.
+
+COUNT_TIMEOUT = 60 * 10
+# Above this many rows whole-table counts are estimated from the largest
+# primary key rather than counted. Deleted rows make it an overestimate,
+# so the last pages of a huge list may come up short or empty
+ESTIMATE_ABOVE = 100_000
+
+
+def _table_key(model):
+    return f"count:{model._meta.label_lower}"
+
+
+def _is_whole_table(queryset):
+    query = queryset.query
+    return not query.where and not query.is_sliced and not query.distinct
+
+
+def cached_count(queryset):
+    """The number of rows in ``queryset``, from the cache when possible."""
+    model = queryset.model
+    if _is_whole_table(queryset):
+        key = _table_key(model)
+    else:
+        sql, params = queryset.order_by().query.sql_with_params()
+        (version,) = get_versions(model)
+        digest = sha1(f"{sql}|{params}".encode()).hexdigest()
+        key = f"count:{model._meta.label_lower}:{version}:{digest}"
+
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    count = None
+    if _is_whole_table(queryset):
+        largest = model._default_manager.aggregate(largest=Max("pk"))["largest"]
+        if largest and largest > ESTIMATE_ABOVE:
+            count = largest
+    if count is None:
+        count = queryset.count()
+
+    cache.set(key, count, timeout=COUNT_TIMEOUT)
+    return count
+
+
+def adjust_count(model, delta):
+    try:
+        cache.incr(_table_key(model), delta)
+    except ValueError:
+        # Not cached, the next page view counts it
+        pass
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator taking its count from cached_count() instead of running a
+    COUNT(*) on every page view.
+    """
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
@@ -0,0 +1,69 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from api_pagination import decode_cursor, encode_cursor, finite_float
+from bands.models import Musician
+
+WORD = re.compile(r"\w+")
+
+
+def fts_query(search_text):
+    """Turn free text into an FTS5 query matching any of its words as a
+    prefix. Words are quoted, so nothing the user types is FTS5 syntax.
+    """
+    words = WORD.findall(search_text)
+    return " OR ".join(f'"{word}"*' for word in words)
+
+
+class RankedMusicians:
+    """Musicians matching an FTS5 query, best match first, read a page at a
+    time with keyset_page(). Pages follow on from the (rank, id) of the
+    last row, so a later page costs no more than the first.
+    """
+
+    def __init__(self, query):
+        self.query = query
+
+    def keyset_page(self, after, limit):
+        where = "bands_musician_fts MATCH %s"
+        params = [self.query]
+        if after:
+            rank, pk = decode_cursor(after, (finite_float, int))
+            where += " AND (rank > %s OR (rank = %s AND rowid > %s))"
+            params += [rank, rank, pk]
+
+        with connection.cursor() as cursor:
+            # Ranked with the bm25() weights set up in the migration
+            cursor.execute(
+                f"SELECT rowid, rank FROM bands_musician_fts WHERE {where} "
+                "ORDER BY rank, rowid LIMIT %s",
+                [*params, limit + 1],
+            )
+            rows = cursor.fetchall()
+
+        musicians = Musician.objects.in_bulk([pk for pk, _ in rows[:limit]])
+        page = [musicians[pk] for pk, _ in rows[:limit] if pk in musicians]
+        if len(rows) <= limit:
+            return page, None
+
+        pk, rank = rows[limit - 1]
+        return page, encode_cursor([rank, pk])
+
+
+def find_musicians(search_text):
+    """Musicians matching any word of ``search_text``, by first name, last
+    name or description. Uses the FTS5 index on SQLite, with prefix
+    matching, accent folding and BM25 ranking. Elsewhere it falls back to
+    matching name prefixes with the ORM.
+    """
+    if connection.vendor == "sqlite":
+        query = fts_query(search_text)
+        return RankedMusicians(query) if query else Musician.objects.none()
+
+    q = Q()
+    for part in search_text.split():
+        q |= Q(first_name__istartswith=part) | Q(last_name__istartswith=part)
+
+    return Musician.objects.filter(q) if q else Musician.objects.none()
@@ -0,0 +1,23 @@
+from django import template
+
+from versions import get_object_versions
+
+register = template.Library()
+
+
+@register.filter
+def version(obj):
+    """The version stamp of a model instance, bumped by the signal
+    receivers whenever it or the related rows shown with it change. Use it
+    as a vary-on argument of the built-in cache tag, so a cached fragment
+    is replaced as soon as it goes stale:
+
+        {% cache 3600 band_musicians band.id band|version %}
+
+    List views can read the stamps of a whole page in one go and set them
+    as ``version_stamp`` on the objects.
+    """
+    stamp = getattr(obj, "version_stamp", None)
+    if stamp is None:
+        (stamp,) = get_object_versions((type(obj), obj.pk))
+    return stamp
@@ -0,0 +1,31 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from bands.images import WIDTHS, derivative_name, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(field, height=50, sizes="80px"):
+    """An <img> of a Musician or Venue picture. Once bands.images has made
+    its derivatives it offers them as WebP and JPEG srcsets, so browsers
+    fetch a scaled down copy instead of the original:
+
+        {% picture venue.picture height=50 sizes="80px" %}
+    """
+    name = field.name
+    if field.instance.processed_picture != name:
+        return format_html('<img src="{}" height="{}" />', field.url, height)
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}" />'
+        '<img src="{}" srcset="{}" sizes="{}" height="{}" /></picture>',
+        srcset(name, "webp"),
+        sizes,
+        default_storage.url(derivative_name(name, WIDTHS[0], "jpg")),
+        srcset(name, "jpg"),
+        sizes,
+        height,
+    )
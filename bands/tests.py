@@ -1,23 +1,48 @@
 # RiffMates/bands/tests.py
 import tempfile
 import io
+import json
 
 from base64 import b64decode
-from datetime import date
+from concurrent.futures import Future
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
 
-from bands.models import Musician, Venue
+from api_pagination import encode_cursor
+from api_serializers import serialize
+from bands.api import BandOut, RoomOut, VenueOut
+from bands.images import derivative_name
+from bands.models import Band, Musician, Room, Venue
+from bands.paginator import cached_count
+from home.models import APIKey
+from promoters.models import Promoter
+from versions import check_shared_cache
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.base import BaseHandler
 from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
 
 
 def raises_an_error():
     raise ValueError()
 
 
+def run_now(fn, *args):
+    # Stands in for the thumbnail executor's submit(), its threads can't
+    # see or write the rows of a TestCase's transaction
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
+
 class TestBands(TestCase):
     def setUp(self):
         self.musician = Musician.objects.create(
@@ -41,6 +66,25 @@ class TestBands(TestCase):
         self.assertEqual(response.context["musician"].id, self.musician.id)
         self.assertIn(self.musician.first_name, str(response.content))
 
+    def test_musician_edit_link(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        url = f"/bands/musician/{self.musician.id}/"
+        edit_url = f"/bands/edit_musician/{self.musician.id}/"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.userprofile.musician_profiles.add(self.musician)
+
+        # Only for users who may edit the musician
+        self.assertNotContains(self.client.get(url), edit_url)
+        for username, shown in [("member", False), ("owner", True), ("admin", True)]:
+            self.client.login(username=username, password=self.PASSWORD)
+            response = self.client.get(url)
+            self.assertIs(shown, response.context["can_edit"])
+            if shown:
+                self.assertContains(response, f'href="{edit_url}"')
+            else:
+                self.assertNotContains(response, edit_url)
+
     def test_musician_404(self):
         url = "/bands/musician/10/"
         response = self.client.get(url)
@@ -63,7 +107,9 @@ class TestBands(TestCase):
             "name": "Name",
             "description": "Description",
         }
-        response = self.client.post(url, data)
+        # Run on_commit callbacks, permissions are refreshed through them
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data)
 
         self.assertEqual(302, response.status_code)
 
@@ -106,6 +152,153 @@ class TestBands(TestCase):
         venue = Venue.objects.first()
         self.assertIsNotNone(venue.picture)
 
+    def test_thumbnails(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = Path(directory.name)
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 600), "red").save(buffer, "JPEG")
+        file = SimpleUploadedFile("stage.jpg", buffer.getvalue())
+        data = {"name": "Name", "description": "Description", "picture": file}
+
+        self.client.login(username="owner", password=self.PASSWORD)
+        with override_settings(MEDIA_ROOT=directory.name):
+            with patch("bands.images._executor.submit", run_now):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post("/bands/edit_venue/0/", data)
+            self.assertEqual(302, response.status_code)
+
+            derivatives = sorted(p.name for p in media.glob("stage.*w.*"))
+            self.assertEqual(8, len(derivatives))
+            with Image.open(media / "stage.160w.webp") as image:
+                self.assertEqual((160, 96), image.size)
+
+            response = self.client.get("/bands/venues/")
+            self.assertContains(response, "/media/stage.320w.webp 320w")
+            self.assertContains(response, 'type="image/webp"')
+
+            # Pages go by what the row recorded, the storage isn't asked
+            cache.clear()
+            with patch("django.core.files.storage.default_storage.exists") as exists:
+                response = self.client.get("/bands/venues/")
+            exists.assert_not_called()
+            self.assertContains(response, "<picture>")
+
+            # They're not orphans
+            out = io.StringIO()
+            call_command("cleanup_images", stdout=out)
+            self.assertIn("No orphaned files found", out.getvalue())
+
+            # Backfilled when missing, pictures from before the rows
+            # recorded it switch to the derivatives
+            for path in media.glob("stage.*w.*"):
+                path.unlink()
+            Venue.objects.update(processed_picture="")
+            cache.clear()
+            response = self.client.get("/bands/venues/")
+            self.assertContains(response, 'src="/media/stage.jpg"')
+            self.assertNotContains(response, "<picture>")
+            out = io.StringIO()
+            call_command("make_thumbnails", workers=1, stdout=out)
+            self.assertIn("Wrote 8 thumbnails for 1 pictures", out.getvalue())
+            # Processed pictures are skipped, unless forced
+            call_command("make_thumbnails", workers=1, stdout=out)
+            self.assertIn("Wrote 0 thumbnails for 0 pictures", out.getvalue())
+            call_command("make_thumbnails", workers=1, force=True, stdout=out)
+            self.assertEqual(2, out.getvalue().count("Wrote 8 thumbnails for 1 "))
+            cache.clear()
+            response = self.client.get("/bands/venues/")
+            self.assertContains(response, "/media/stage.320w.webp 320w")
+
+    def test_picture_limits(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = Path(directory.name)
+        self.client.login(username="owner", password=self.PASSWORD)
+
+        def upload(content, name="stage.jpg", submit=run_now):
+            data = {
+                "name": "Name",
+                "description": "Description",
+                "picture": SimpleUploadedFile(name, content),
+            }
+            with patch("bands.images._executor.submit", submit):
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post("/bands/edit_venue/0/", data)
+            return response
+
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = "Camera Maker"
+        Image.new("RGB", (3000, 1000), "red").save(buffer, "JPEG", exif=exif)
+        big = buffer.getvalue()
+
+        with override_settings(
+            MEDIA_ROOT=directory.name,
+            PICTURE_MAX_BYTES=len(big),
+            PICTURE_MAX_PIXELS=3000 * 1000,
+        ):
+            response = upload(big + b"x")
+            self.assertContains(response, "Pictures can be at most")
+            response = upload(b"not an image")
+            self.assertContains(response, "Upload a valid image")
+
+            # Rejected from the header, the pixels are never decoded
+            with override_settings(PICTURE_MAX_PIXELS=3000 * 1000 - 1):
+                with patch.object(Image.Image, "load") as load:
+                    response = upload(big)
+                load.assert_not_called()
+            self.assertContains(response, "Pictures can be at most 2 megapixels")
+
+            # Accepted, then scaled down and stripped of its metadata
+            with override_settings(PICTURE_MAX_SIDE=1200):
+                response = upload(big)
+            self.assertEqual(302, response.status_code)
+            venue = Venue.objects.order_by("id").last()
+            name = venue.picture.name
+            # Written next to the original, which is then removed
+            self.assertNotEqual("stage.jpg", name)
+            self.assertFalse((media / "stage.jpg").exists())
+            self.assertEqual([], list(media.glob("stage.*w.*")))
+            with Image.open(media / name) as image:
+                self.assertEqual((1200, 400), image.size)
+                self.assertEqual(0, len(image.getexif()))
+            with Image.open(media / derivative_name(name, 640, "jpg")) as image:
+                self.assertEqual((640, 213), image.size)
+
+            # Existing pictures are normalized by make_thumbnails too
+            with open(media / "old.jpg", "wb") as f:
+                f.write(big)
+            Musician.objects.filter(id=self.musician.id).update(picture="old.jpg")
+            with override_settings(PICTURE_MAX_SIDE=600):
+                call_command("make_thumbnails", workers=1, stdout=io.StringIO())
+            self.musician.refresh_from_db()
+            self.assertFalse((media / "old.jpg").exists())
+            with Image.open(media / self.musician.picture.name) as image:
+                self.assertEqual((600, 200), image.size)
+
+            # So are pictures whose job was lost to a restart
+            def lost(fn, *args):
+                future = Future()
+                future.cancel()
+                return future
+
+            self.assertEqual(302, upload(big, "lost.jpg", lost).status_code)
+            venue = Venue.objects.order_by("id").last()
+            self.assertEqual(("lost.jpg", ""), (venue.picture, venue.processed_picture))
+            out = io.StringIO()
+            with override_settings(PICTURE_MAX_SIDE=600):
+                call_command("make_thumbnails", workers=1, stdout=out)
+            self.assertIn("Wrote 8 thumbnails for 1 pictures", out.getvalue())
+            venue.refresh_from_db()
+            self.assertFalse((media / "lost.jpg").exists())
+            self.assertEqual(venue.processed_picture, venue.picture.name)
+            with Image.open(media / venue.picture.name) as image:
+                self.assertEqual((600, 200), image.size)
+                self.assertEqual(0, len(image.getexif()))
+
     def test_edit_musician(self):
         self.client.login(username="owner", password=self.PASSWORD)
 
@@ -209,6 +402,238 @@ class TestBands(TestCase):
         self.assertEqual(10, len(response.context["musicians"]))
         self.assertFalse(response.context["page"].has_other_pages())
 
+    def test_venues_view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(30):
+                venue = Venue.objects.create(name=f"Venue {i:02}")
+                Room.objects.create(name=f"Room {i:02}", venue=venue)
+                if i % 2:
+                    self.owner.userprofile.venues_controlled.add(venue)
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.login(username="owner", password=self.PASSWORD)
+        # Session, user, controlled musicians and venues, table size and
+        # count, page and rooms, however many venues there are
+        with self.assertNumQueries(8):
+            response = self.client.get("/bands/venues/?items_per_page=20")
+        self.assertEqual(200, response.status_code)
+
+        venues = response.context["venues"]
+        self.assertEqual(20, len(venues))
+        self.assertEqual(
+            [bool(i % 2) for i in range(20)], [v.controlled for v in venues]
+        )
+        self.assertContains(response, "Room 19")
+        self.assertContains(response, f"/bands/edit_venue/{venues[1].id}/")
+
+        # The permissions, count and rooms are cached after that
+        with self.assertNumQueries(3):
+            response = self.client.get("/bands/venues/?items_per_page=20")
+        self.assertContains(response, "Room 19")
+
+        # A new room only refetches its venue's rooms, once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(name="Extra Room", venue=venues[3])
+        with self.assertNumQueries(4):
+            response = self.client.get("/bands/venues/?items_per_page=20")
+        self.assertContains(response, "Extra Room")
+
+    def test_permissions_cache(self):
+        venue = Venue.objects.create(name="Venue")
+        Room.objects.create(name="Room", venue=venue)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.login(username="owner", password=self.PASSWORD)
+
+        response = self.client.get(f"/bands/room-editor/{venue.id}/")
+        self.assertEqual(404, response.status_code)
+
+        # Changing the user's venues replaces the cached snapshot once
+        # the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.userprofile.venues_controlled.add(venue)
+        response = self.client.get(f"/bands/room-editor/{venue.id}/")
+        self.assertEqual(200, response.status_code)
+
+        # Session, user, venue and rooms, the permissions come from the cache
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/bands/room-editor/{venue.id}/")
+        self.assertEqual(200, response.status_code)
+
+        # As does removing the venue from the other side
+        with self.captureOnCommitCallbacks(execute=True):
+            venue.userprofile_set.clear()
+        response = self.client.get(f"/bands/room-editor/{venue.id}/")
+        self.assertEqual(404, response.status_code)
+
+    def test_async_middleware(self):
+        # No middleware makes an ASGI request fall back to a thread, the
+        # handler only logs adapting them in debug mode
+        with override_settings(DEBUG=True):
+            with self.assertNoLogs("django.request", level="DEBUG"):
+                BaseHandler().load_middleware(is_async=True)
+
+    def test_musician_restricted(self):
+        other = Musician.objects.create(
+            first_name="Other", last_name="Musician", birth=date(1900, 1, 1)
+        )
+        mate = Musician.objects.create(
+            first_name="Band", last_name="Mate", birth=date(1900, 1, 1)
+        )
+        self.member.userprofile.musician_profiles.add(self.musician)
+        for i in range(10):
+            Band.objects.create(name=f"Band {i}").musicians.add(other)
+        Band.objects.create(name="Shared").musicians.add(self.musician, mate)
+
+        self.client.login(username="member", password=self.PASSWORD)
+        url = "/bands/musician_restricted/{}/"
+
+        # Session, user, musician, profile and the band-mate check
+        with self.assertNumQueries(5):
+            response = self.client.get(url.format(mate.id))
+        self.assertEqual(200, response.status_code)
+
+        response = self.client.get(url.format(self.musician.id))
+        self.assertEqual(200, response.status_code)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(url.format(other.id))
+        self.assertEqual(404, response.status_code)
+
+    def test_search_musicians(self):
+        birth = date(1900, 1, 1)
+        bjork = Musician.objects.create(
+            first_name="Björk", last_name="Guðmundsdóttir", birth=birth
+        )
+        fan = Musician.objects.create(
+            first_name="Jo",
+            last_name="Fan",
+            birth=birth,
+            description="Plays covers of Bjork songs",
+        )
+        Musician.objects.create(first_name="Someone", last_name="Else", birth=birth)
+
+        def search(text):
+            response = self.client.get(
+                "/bands/search-musicians/", {"search_text": text}
+            )
+            self.assertEqual(200, response.status_code)
+            return [musician.id for musician in response.context["musicians"]]
+
+        # Accents are folded, words match as prefixes and name matches rank
+        # above description matches
+        self.assertEqual([bjork.id, fan.id], search("bjo"))
+        self.assertEqual([bjork.id], search("GU"))
+        self.assertEqual([], search('" OR *'))
+
+        # The index follows updates and deletes
+        bjork.first_name = "Bjarni"
+        bjork.save()
+        self.assertEqual([fan.id], search("bjork"))
+        fan.delete()
+        self.assertEqual([], search("bjork"))
+
+    def test_search_musicians_scroll(self):
+        for i in range(5):
+            Musician.objects.create(
+                first_name=f"Drummer{i}", last_name="Smith", birth=date(1900, 1, 1)
+            )
+
+        url = "/bands/search-musicians/"
+        data = {"search_text": "smith", "items_per_page": 2}
+        names = []
+        with self.assertNumQueries(2):
+            response = self.client.get(url, data)
+        while True:
+            names += [m.first_name for m in response.context["musicians"]]
+            cursor = response.context["next_cursor"]
+            if cursor is None:
+                break
+            self.assertContains(response, f"after={cursor}")
+            # Later pages pick up from the cursor, with no count
+            with self.assertNumQueries(2):
+                response = self.client.get(
+                    url, {**data, "after": cursor}, headers={"HX-Request": "true"}
+                )
+
+        self.assertEqual(sorted(f"Drummer{i}" for i in range(5)), sorted(names))
+        response = self.client.get(url, {**data, "after": "nonsense"})
+        self.assertEqual(400, response.status_code)
+        for values in ([{}, 1], ["x", "y"], [float("nan"), 1], [None, 1]):
+            response = self.client.get(url, {**data, "after": encode_cursor(values)})
+            self.assertEqual(400, response.status_code)
+
+    def test_cached_counts(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        response = self.client.get("/bands/musicians/?items_per_page=1")
+        self.assertEqual(1, response.context["page"].paginator.num_pages)
+
+        # Adjusted by the signal receivers, without a recount
+        Musician.objects.create(first_name="A", last_name="B", birth=date(1900, 1, 1))
+        with self.assertNumQueries(1):
+            response = self.client.get("/bands/musicians/?items_per_page=1")
+        self.assertEqual(2, response.context["page"].paginator.num_pages)
+        self.musician.delete()
+        response = self.client.get("/bands/musicians/?items_per_page=1")
+        self.assertEqual(1, response.context["page"].paginator.num_pages)
+
+        # Filtered counts are recounted after any write
+        musicians = Musician.objects.filter(last_name="B")
+        self.assertEqual(1, cached_count(musicians))
+        with self.captureOnCommitCallbacks(execute=True):
+            Musician.objects.create(
+                first_name="C", last_name="B", birth=date(1900, 1, 1)
+            )
+        self.assertEqual(2, cached_count(musicians))
+
+        # Huge tables are estimated from the largest primary key
+        with patch("bands.paginator.ESTIMATE_ABOVE", 0):
+            cache.clear()
+            self.assertEqual(
+                Musician.objects.latest("id").id, cached_count(Musician.objects.all())
+            )
+
+    def test_fragment_cache(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        band = Band.objects.create(name="Band")
+        band.musicians.add(self.musician)
+        band_url = f"/bands/band/{band.id}/"
+        musician_url = f"/bands/musician/{self.musician.id}/"
+
+        self.client.get(band_url)
+        self.client.get(musician_url)
+        # Only the band or musician itself is fetched
+        with self.assertNumQueries(1):
+            response = self.client.get(band_url)
+        self.assertContains(response, "First Last")
+        with self.assertNumQueries(1):
+            response = self.client.get(musician_url)
+        self.assertContains(response, ">Band</a>")
+
+        # Membership changes and renames replace the fragments, once they
+        # commit
+        other = Musician.objects.create(
+            first_name="New", last_name="Member", birth=date(1900, 1, 1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            band.musicians.add(other)
+        self.assertContains(self.client.get(band_url), "New Member")
+        band.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            band.save()
+        self.assertContains(self.client.get(musician_url), ">Renamed</a>")
+        self.musician.first_name = "Changed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.musician.save()
+        self.assertContains(self.client.get(band_url), "Changed Last")
+        with self.captureOnCommitCallbacks(execute=True):
+            band.delete()
+        self.assertNotContains(self.client.get(musician_url), "Renamed")
+
 
 class TestMusiciansCommand(TestCase):
     def setUp(self):
@@ -239,3 +664,558 @@ class APITests(TestCase):
 
         self.assertEqual(response.name, "some venue name")
         self.assertEqual(response.description, "some venue description")
+
+    def test_bands_cursor_pagination(self):
+        for name in ["Delta", "Alpha", "Charlie", "Bravo", "Echo"]:
+            Band.objects.create(name=name)
+
+        # No paging arguments returns everything
+        response = self.client.get("/api/v1/bands/bands/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(5, len(response.json()))
+        self.assertNotIn("Link", response)
+
+        names = []
+        url = "/api/v1/bands/bands/?limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code)
+            names.extend(band["name"] for band in response.json())
+
+            url = None
+            if "Link" in response:
+                url = response["Link"].split(">")[0].lstrip("<")
+
+        self.assertEqual(["Alpha", "Bravo", "Charlie", "Delta", "Echo"], names)
+
+        # Filters still apply in cursor mode
+        response = self.client.get("/api/v1/bands/bands/?limit=2&name=c")
+        self.assertEqual(["Charlie"], [band["name"] for band in response.json()])
+
+        response = self.client.get("/api/v1/bands/bands/?after=garbage")
+        self.assertEqual(400, response.status_code)
+
+        # Cursors with values of the wrong type
+        for values in (["a", "x"], [None, None], ["a", [1]]):
+            cursor = encode_cursor(values)
+            response = self.client.get(f"/api/v1/bands/bands/?after={cursor}")
+            self.assertEqual(400, response.status_code)
+
+    def test_list_query_counts(self):
+        def populate(count):
+            for x in range(count):
+                musician = Musician.objects.create(
+                    first_name=f"First{x}", last_name=f"Last{x}", birth=date(1900, 1, 1)
+                )
+                band = Band.objects.create(name=f"Band{x}")
+                band.musicians.add(musician)
+                venue = Venue.objects.create(name=f"Venue{x}")
+                Room.objects.create(name=f"Room{x}", venue=venue)
+
+        # One query for the rows plus one per prefetched relation,
+        # regardless of how many rows there are
+        populate(2)
+        with self.assertNumQueries(2):
+            self.client.get("/api/v1/bands/bands/")
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/bands/venues/")
+        self.assertEqual("Room0", response.json()[0]["rooms"][0]["name"])
+
+        populate(5)
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/v1/bands/bands/")
+        self.assertEqual("First0", response.json()[0]["musicians"][0]["first_name"])
+        with self.assertNumQueries(2):
+            self.client.get("/api/v1/bands/venues/")
+
+    def test_slug_lookup(self):
+        band = Band.objects.create(name="The Band")
+        self.assertEqual(f"the-band-{band.id}", band.slug)
+
+        band.name = "Renamed Band"
+        band.save(update_fields=["name"])
+        band.refresh_from_db()
+        self.assertEqual(f"renamed-band-{band.id}", band.slug)
+
+        response = self.client.get(f"/api/v1/bands/band/slug/{band.slug}")
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(band.slug, data["slug"])
+        self.assertEqual(f"/api/v1/bands/band/{band.id}", data["url"])
+
+        venue = Venue.objects.create(name="The Venue")
+        response = self.client.get(f"/api/v1/bands/venue/slug/{venue.slug}/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(f"/api/v1/bands/venue/{venue.id}/", response.json()["url"])
+
+        response = self.client.get("/api/v1/bands/venue/slug/missing-1/")
+        self.assertEqual(404, response.status_code)
+
+    def test_etag(self):
+        venue = Venue.objects.create(name="Venue")
+        url = f"/api/v1/bands/venue/{venue.id}/"
+
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        etag = response["ETag"]
+
+        # Unchanged data, answered without touching the database
+        with self.assertNumQueries(0):
+            response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+
+        # Adding a room changes the venue's response once it commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Room.objects.create(name="Room", venue=venue)
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(304, response.status_code)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+        # Band membership changes invalidate the band list
+        band = Band.objects.create(name="Band")
+        response = self.client.get("/api/v1/bands/bands/")
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            band.musicians.add(
+                Musician.objects.create(
+                    first_name="F", last_name="L", birth=date(1900, 1, 1)
+                )
+            )
+        response = self.client.get(
+            "/api/v1/bands/bands/", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(200, response.status_code)
+
+    @override_settings(DEBUG=False)
+    def test_shared_cache_check(self):
+        self.assertEqual(["versions.W001"], [w.id for w in check_shared_cache(None)])
+        shared = {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "cache",
+        }
+        with override_settings(CACHES={"default": shared}):
+            self.assertEqual([], check_shared_cache(None))
+
+    def test_bulk_endpoints(self):
+        _, raw_key = APIKey.generate("tests", "write")
+        headers = {"X-API-KEY": raw_key}
+
+        data = [
+            {"name": "First Venue", "description": "Description"},
+            {"name": "A venue name that is far too long"},
+            {"name": "Second Venue"},
+        ]
+        response = self.client.post(
+            "/api/v1/bands/venues/bulk/",
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+        self.assertEqual(200, response.status_code)
+        results = response.json()
+        self.assertEqual([0, 1, 2], [result["index"] for result in results])
+        self.assertIsNone(results[0]["error"])
+        self.assertIn("name", results[1]["error"])
+        self.assertEqual(2, Venue.objects.count())
+
+        venue = Venue.objects.get(id=results[2]["id"])
+        self.assertEqual(f"second-venue-{venue.id}", venue.slug)
+
+        data = [
+            {"id": venue.id, "name": "Renamed Venue"},
+            {"id": 0, "name": "Missing Venue"},
+        ]
+        response = self.client.put(
+            "/api/v1/bands/venues/bulk/",
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+        results = response.json()
+        self.assertIsNone(results[0]["error"])
+        self.assertIn("does not exist", results[1]["error"])
+        venue.refresh_from_db()
+        self.assertEqual("Renamed Venue", venue.name)
+        self.assertEqual(f"renamed-venue-{venue.id}", venue.slug)
+
+        data = [
+            {"name": "Room", "venue_id": venue.id},
+            {"name": "Room", "venue_id": 0},
+        ]
+        response = self.client.post(
+            "/api/v1/bands/rooms/bulk/",
+            data,
+            content_type="application/json",
+            headers=headers,
+        )
+        results = response.json()
+        self.assertIsNone(results[0]["error"])
+        self.assertIn("venue_id", results[1]["error"])
+        self.assertEqual(1, venue.room_set.count())
+
+        # Writes still need a key
+        response = self.client.post(
+            "/api/v1/bands/musicians/bulk/", [], content_type="application/json"
+        )
+        self.assertEqual(401, response.status_code)
+
+    def test_ndjson_export(self):
+        venue = Venue.objects.create(name="Venue")
+        Room.objects.create(name="Room A", venue=venue)
+        Room.objects.create(name="Room B", venue=venue)
+        Venue.objects.create(name="Empty Venue")
+        _, raw_key = APIKey.generate("mirror", "read")
+        _, writer = APIKey.generate("writer", "write")
+        headers = {"X-API-KEY": raw_key}
+
+        # Only for keys with the read scope
+        for key_headers in [{}, {"X-API-KEY": writer}]:
+            response = self.client.get(
+                "/api/v1/bands/venues/export.ndjson", headers=key_headers
+            )
+            self.assertEqual(401, response.status_code)
+
+        response = self.client.get(
+            "/api/v1/bands/venues/export.ndjson", headers=headers
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual("application/x-ndjson", response["Content-Type"])
+
+        with self.assertNumQueries(2):
+            lines = b"".join(response.streaming_content).decode().splitlines()
+
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(["Venue", "Empty Venue"], [row["name"] for row in rows])
+        self.assertEqual(["Room A", "Room B"], [r["name"] for r in rows[0]["rooms"]])
+        self.assertEqual([], rows[1]["rooms"])
+
+        response = self.client.get("/api/v1/bands/rooms/export.ndjson", headers=headers)
+        rows = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual([venue.id, venue.id], [row["venue"] for row in rows])
+
+        # Under WSGI a sync iterator, an async one would be buffered
+        self.assertFalse(response.is_async)
+
+    async def test_ndjson_export_asgi(self):
+        venue = await Venue.objects.acreate(name="Venue")
+        await Room.objects.acreate(name="Room A", venue=venue)
+        _, raw_key = await sync_to_async(APIKey.generate)("mirror", "read")
+
+        response = await self.async_client.get(
+            "/api/v1/bands/venues/export.ndjson", headers={"X-API-KEY": raw_key}
+        )
+        self.assertEqual(200, response.status_code)
+        # Under ASGI an async iterator, a sync one would be buffered
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(["Venue"], [row["name"] for row in rows])
+        self.assertEqual(["Room A"], [room["name"] for room in rows[0]["rooms"]])
+
+    async def test_async_reads(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        venue = await Venue.objects.acreate(name="Venue")
+        await Room.objects.acreate(name="Room", venue=venue)
+        band = await Band.objects.acreate(name="Band")
+        await Promoter.objects.acreate(full_name="Full Name", common_name="Name")
+
+        # The read endpoints through the ASGI handler
+        response = await self.async_client.get("/api/v1/bands/venues/")
+        self.assertEqual(["Room"], [r["name"] for r in response.json()[0]["rooms"]])
+        response = await self.async_client.get(f"/api/v1/bands/venue/{venue.id}/")
+        self.assertEqual("Venue", response.json()["name"])
+        response = await self.async_client.get(f"/api/v1/bands/band/{band.id}")
+        self.assertEqual("Band", response.json()["name"])
+        response = await self.async_client.get("/api/v1/bands/bands/?limit=1")
+        self.assertEqual(["Band"], [b["name"] for b in response.json()])
+        response = await self.async_client.get("/api/v1/promoters/promoters/")
+        self.assertEqual(["Full Name"], [p["full_name"] for p in response.json()])
+        response = await self.async_client.get("/api/v1/bands/venue/0/")
+        self.assertEqual(404, response.status_code)
+
+        # Lists and batches are serialized with the async ORM, not by the
+        # sync serializer in a thread
+        with patch("api_serializers._load", side_effect=AssertionError):
+            response = await self.async_client.get("/api/v1/bands/venues/")
+            self.assertEqual(["Room"], [r["name"] for r in response.json()[0]["rooms"]])
+            url = f"/api/v1/bands/bands/batch/?ids={band.id},0"
+            response = await self.async_client.get(url)
+            data = response.json()
+            self.assertEqual(["Band"], [b["name"] for b in data["results"]])
+            self.assertEqual([], data["results"][0]["musicians"])
+            self.assertEqual([0], data["missing"])
+
+        # ETags and cached responses, with the versions read asynchronously
+        url = f"/api/v1/bands/venue/{venue.id}/"
+        etag = (await self.async_client.get(url))["ETag"]
+        response = await self.async_client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(304, response.status_code)
+        # update() sends no signals, the cached response is still served
+        await Venue.objects.filter(id=venue.id).aupdate(name="Changed")
+        response = await self.async_client.get(url)
+        self.assertEqual("Venue", response.json()["name"])
+
+    def test_sparse_fields(self):
+        venue = Venue.objects.create(name="Venue", description="Description")
+        Room.objects.create(name="Room", venue=venue)
+
+        # Nested rooms aren't prefetched when they aren't asked for
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/v1/bands/venues/?fields=id,name")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{"id": venue.id, "name": "Venue"}], response.json())
+
+        url = f"/api/v1/bands/venue/{venue.id}/?fields=rooms,url"
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual({"rooms", "url"}, data.keys())
+        self.assertEqual("Room", data["rooms"][0]["name"])
+
+        # Paging and sparse fields together
+        Venue.objects.create(name="Zed Venue")
+        response = self.client.get("/api/v1/bands/venues/?fields=id&limit=1")
+        self.assertEqual([{"id": venue.id}], response.json())
+        self.assertIn("Link", response)
+
+        response = self.client.get("/api/v1/bands/bands/?fields=nope")
+        self.assertEqual(400, response.status_code)
+
+    def test_fast_serializer_matches_schema(self):
+        musician = Musician.objects.create(
+            first_name="First", last_name="Last", birth=date(1900, 1, 2)
+        )
+        band = Band.objects.create(name="Band")
+        band.musicians.add(musician)
+        Band.objects.create(name="No Members")
+        venue = Venue.objects.create(name="Venue", description="Description")
+        Room.objects.create(name="Room", venue=venue)
+
+        for model, schema in [(Band, BandOut), (Venue, VenueOut), (Room, RoomOut)]:
+            expected = [
+                schema.from_orm(obj).model_dump() for obj in model.objects.all()
+            ]
+            self.assertEqual(expected, serialize(model.objects.all(), schema))
+
+        response = self.client.get("/api/v1/bands/bands/")
+        self.assertEqual("1900-01-02", response.json()[0]["musicians"][0]["birth"])
+
+    def test_stored_api_keys(self):
+        url = "/api/v1/bands/musicians/bulk/"
+
+        _, writer = APIKey.generate("writer", "read write")
+        _, reader = APIKey.generate("reader", "read")
+
+        # Non-ASCII keys are refused, not an error
+        with override_settings(NINJA_API_KEY="legacy"):
+            response = self.client.post(
+                url, [], content_type="application/json", headers={"X-API-KEY": "ké"}
+            )
+        self.assertEqual(401, response.status_code)
+        expired, expired_key = APIKey.generate(
+            "expired", "write", timezone.now() - timedelta(days=1)
+        )
+
+        response = self.client.post(
+            url, [], content_type="application/json", headers={"X-API-KEY": writer}
+        )
+        self.assertEqual(200, response.status_code)
+
+        # A verified key is answered from the in-process cache
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                url,
+                [],
+                content_type="application/json",
+                headers={"X-API-KEY": writer},
+            )
+        self.assertEqual(200, response.status_code)
+
+        for key in [reader, expired_key, writer + "x", "nope"]:
+            response = self.client.post(
+                url, [], content_type="application/json", headers={"X-API-KEY": key}
+            )
+            self.assertEqual(401, response.status_code)
+
+        # Revoking takes effect straight away
+        stored = APIKey.objects.get(name="writer")
+        stored.revoked = True
+        stored.save()
+        response = self.client.post(
+            url, [], content_type="application/json", headers={"X-API-KEY": writer}
+        )
+        self.assertEqual(401, response.status_code)
+
+    @override_settings(
+        THROTTLE_RATES={
+            "search": "2/min",
+            "api-list": "1/hour",
+            "api-bulk": "1/hour",
+            "api-export": "1/hour",
+        }
+    )
+    def test_throttling(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        _, raw_key = APIKey.generate("integrator", "write")
+
+        for _ in range(2):
+            response = self.client.get("/bands/search-musicians/?search_text=a")
+            self.assertEqual(200, response.status_code)
+
+        # Rejected before the view touches the database
+        with self.assertNumQueries(0):
+            response = self.client.get("/bands/search-musicians/?search_text=a")
+        self.assertEqual(429, response.status_code)
+        self.assertEqual("30", response["Retry-After"])
+
+        # A made up X-Forwarded-For doesn't get a new bucket
+        response = self.client.get(
+            "/bands/search-musicians/?search_text=a",
+            headers={"X-Forwarded-For": "203.0.113.7"},
+        )
+        self.assertEqual(429, response.status_code)
+
+        response = self.client.get("/api/v1/bands/bands/")
+        self.assertEqual(200, response.status_code)
+        response = self.client.get("/api/v1/bands/bands/")
+        self.assertEqual(429, response.status_code)
+        self.assertEqual("3600", response["Retry-After"])
+
+        # Routes in the same scope share a bucket
+        response = self.client.get("/api/v1/promoters/promoters/")
+        self.assertEqual(429, response.status_code)
+        response = self.client.get("/api/v1/bands/bands/batch/?ids=1")
+        self.assertEqual(429, response.status_code)
+
+        # Authenticated clients are limited per key, not per address
+        _, other_key = APIKey.generate("other", "write")
+        url = "/api/v1/bands/musicians/bulk/"
+        for key, status in [(raw_key, 200), (raw_key, 429), (other_key, 200)]:
+            response = self.client.post(
+                url, [], content_type="application/json", headers={"X-API-KEY": key}
+            )
+            self.assertEqual(status, response.status_code)
+
+        # Exports have their own bucket
+        _, reader = APIKey.generate("mirror", "read")
+        headers = {"X-API-KEY": reader}
+        response = self.client.get("/api/v1/bands/bands/export.ndjson", headers=headers)
+        self.assertEqual(200, response.status_code)
+        response = self.client.get(
+            "/api/v1/bands/venues/export.ndjson", headers=headers
+        )
+        self.assertEqual(429, response.status_code)
+
+    def test_response_cache(self):
+        _, raw_key = APIKey.generate("tests", "write")
+        musician = Musician.objects.create(
+            first_name="F", last_name="L", birth=date(1900, 1, 1)
+        )
+        band = Band.objects.create(name="Band")
+        band.musicians.add(musician)
+        other = Band.objects.create(name="Other")
+        url = f"/api/v1/bands/band/{band.id}"
+
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual("F", response.json()["musicians"][0]["first_name"])
+
+        # Editing a member through the API drops the band's entry
+        data = {
+            "first_name": "G",
+            "last_name": "L",
+            "birth": "1900-01-01",
+            "description": "",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f"/api/v1/bands/musician/{musician.id}/",
+                data,
+                content_type="application/json",
+                headers={"X-API-KEY": raw_key},
+            )
+        self.assertEqual(200, response.status_code)
+        response = self.client.get(url)
+        self.assertEqual("G", response.json()["musicians"][0]["first_name"])
+
+        # Other bands keep theirs
+        self.client.get(f"/api/v1/bands/band/{other.id}")
+        with self.captureOnCommitCallbacks(execute=True):
+            band.musicians.remove(musician)
+        with self.assertNumQueries(0):
+            self.client.get(f"/api/v1/bands/band/{other.id}")
+        self.assertEqual([], self.client.get(url).json()["musicians"])
+
+        # Moving a room invalidates both venues
+        first = Venue.objects.create(name="First")
+        second = Venue.objects.create(name="Second")
+        room = Room.objects.create(name="Room", venue=first)
+        self.client.get(f"/api/v1/bands/venue/{first.id}/")
+        self.client.get(f"/api/v1/bands/venue/{second.id}/")
+        room = Room.objects.get(id=room.id)
+        room.venue = second
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        response = self.client.get(f"/api/v1/bands/venue/{first.id}/")
+        self.assertEqual([], response.json()["rooms"])
+        response = self.client.get(f"/api/v1/bands/venue/{second.id}/")
+        self.assertEqual("Room", response.json()["rooms"][0]["name"])
+
+        # However the id is spelled, the entry is dropped
+        url = f"/api/v1/bands/venue/0{first.id}/"
+        self.assertEqual("First", self.client.get(url).json()["name"])
+        first.name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save()
+        self.assertEqual("Renamed", self.client.get(url).json()["name"])
+
+        promoter = Promoter.objects.create(
+            common_name="P", full_name="Promoter", famous_for="Shows"
+        )
+        url = f"/api/v1/promoters/promoter/{promoter.id}"
+        self.client.get(url)
+        promoter.full_name = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            promoter.save()
+        self.assertEqual("Renamed", self.client.get(url).json()["full_name"])
+
+    def test_batch_fetch(self):
+        musician = Musician.objects.create(
+            first_name="F", last_name="L", birth=date(1900, 1, 1)
+        )
+        bands = [Band.objects.create(name=f"Band {i}") for i in range(3)]
+        for band in bands:
+            band.musicians.add(musician)
+
+        ids = [bands[2].id, 9999, bands[0].id, bands[2].id]
+        url = "/api/v1/bands/bands/batch/?ids=" + ",".join(map(str, ids))
+        # One query for the bands and one for their musicians
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+
+        data = response.json()
+        self.assertEqual(["Band 2", "Band 0"], [b["name"] for b in data["results"]])
+        self.assertEqual("F", data["results"][0]["musicians"][0]["first_name"])
+        self.assertEqual([9999], data["missing"])
+
+        response = self.client.get(
+            f"/api/v1/bands/musicians/batch/?ids={musician.id}&fields=last_name"
+        )
+        self.assertEqual(
+            {"results": [{"last_name": "L"}], "missing": []}, response.json()
+        )
+
+        venue = Venue.objects.create(name="Venue")
+        Room.objects.create(name="Room", venue=venue)
+        response = self.client.get(f"/api/v1/bands/venues/batch/?ids={venue.id}")
+        self.assertEqual("Room", response.json()["results"][0]["rooms"][0]["name"])
+
+        for ids in ["", "1,x", ",".join(map(str, range(101)))]:
+            response = self.client.get(f"/api/v1/bands/venues/batch/?ids={ids}")
+            self.assertEqual(400, response.status_code)
@@ -1,13 +1,24 @@
 # RiffMates/bands/urls.py
 from bands import views
 from django.urls import path
+from django_distill import distill_path
+from static_site import band_params, musician_params, no_params
 
 urlpatterns = [
-    path("musician/<int:musician_id>/", views.musician, name="musician"),
-    path("musicians/", views.musicians, name="musicians"),
-    path("band/<int:band_id>/", views.band, name="band"),
-    path("bands/", views.bands, name="bands"),
-    path("venues/", views.venues, name="venues"),
+    distill_path(
+        "musician/<int:musician_id>/",
+        views.musician,
+        name="musician",
+        distill_func=musician_params,
+    ),
+    distill_path(
+        "musicians/", views.musicians, name="musicians", distill_func=no_params
+    ),
+    distill_path(
+        "band/<int:band_id>/", views.band, name="band", distill_func=band_params
+    ),
+    distill_path("bands/", views.bands, name="bands", distill_func=no_params),
+    distill_path("venues/", views.venues, name="venues", distill_func=no_params),
     path("restricted_page/", views.restricted_page, name="restricted_page"),
     path(
         "musician_restricted/<int:musician_id>/",
@@ -1,31 +1,35 @@
 # RiffMates/bands/views.py
 from datetime import date
 import urllib
-from time import sleep
 from bands.forms import MusicianForm, VenueForm, RoomForm
+from bands.middleware import get_permissions
 from bands.models import Band, Musician, Venue, Room
+from bands.paginator import CachedCountPaginator
+from bands.search import find_musicians
+from ninja.errors import HttpError
+from api_pagination import keyset_page
 from django.http import HttpResponse
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Q, QuerySet, prefetch_related_objects
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.paginator import Paginator
+from django.core.exceptions import BadRequest
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from throttling import throttle
+from versions import get_object_versions
 
 
 def musician(request, musician_id):
     musician = get_object_or_404(Musician, id=musician_id)
-    musician.controller = False
-    if request.user.is_staff:
-        musician.controller = True
-    elif hasattr(request.user, "userprofile"):
-        # This view can be used by people who aren't logged in,
-        # those users don't have a profile, need to validate
-        # one exists before using it
-        profile = request.user.userprofile
-        musician.controller = profile.musician_profiles.filter(id=musician_id).exists()
+    # Anonymous users have empty permissions, so this works for them too
+    musician.controller = (
+        request.user.is_staff or musician.id in request.permissions.musician_ids
+    )
 
     data = {
         "musician": musician,
+        "can_edit": musician.controller,
     }
 
     return render(request, "musician.html", data)
@@ -36,9 +40,7 @@ def edit_musician(request, musician_id=0):
         musician = get_object_or_404(Musician, id=musician_id)
         if (
             not request.user.is_staff
-            and not request.user.userprofile.musician_profiles.filter(
-                id=musician_id
-            ).exists()
+            and musician.id not in request.permissions.musician_ids
         ):
             raise Http404("Can only edit controlled musicians")
 
@@ -94,10 +96,26 @@ def _get_page_num(request, paginator):
     return page_num
 
 
+def _get_keyset_page(request, results, ordering):
+    # Get the page of results after the "after" cursor, and the cursor for
+    # the page following it (None on the last page). Search results ranked
+    # by the full-text index page themselves, querysets are ordered on
+    # ``ordering``, which must end with the primary key
+    after = request.GET.get("after")
+    items_per_page = _get_items_per_page(request)
+
+    try:
+        if isinstance(results, QuerySet):
+            return keyset_page(results, after, items_per_page, ordering)
+        return results.keyset_page(after, items_per_page)
+    except HttpError:
+        raise BadRequest("Invalid cursor")
+
+
 def musicians(request):
     all_musicians = Musician.objects.all().order_by("last_name")
     items_per_page = _get_items_per_page(request)
-    paginator = Paginator(all_musicians, items_per_page)
+    paginator = CachedCountPaginator(all_musicians, items_per_page)
     page_num = _get_page_num(request, paginator)
     page = paginator.page(page_num)
 
@@ -120,7 +138,7 @@ def band(request, band_id):
 def bands(request):
     all_bands = Band.objects.all().order_by("name")
     items_per_page = _get_items_per_page(request)
-    paginator = Paginator(all_bands, items_per_page)
+    paginator = CachedCountPaginator(all_bands, items_per_page)
 
     page_num = _get_page_num(request, paginator)
 
@@ -136,24 +154,30 @@ def bands(request):
 
 def venues(request):
     all_venues = Venue.objects.all().order_by("name")
-    profile = getattr(request.user, "userprofile", None)
-    if profile:
-        for venue in all_venues:
-            # Mark the venue as "controlled" if the logged in user is
-            # associated with the venue
-            venue.controlled = profile.venues_controlled.filter(id=venue.id).exists()
-    else:
-        # Anonymous user, can't be associated with the venue
-        for venue in all_venues:
-            venue.controlled = False
-
     items_per_page = _get_items_per_page(request)
-    paginator = Paginator(all_venues, items_per_page)
+    paginator = CachedCountPaginator(all_venues, items_per_page)
 
     page_num = _get_page_num(request, paginator)
 
     page = paginator.page(page_num)
 
+    # Mark the venues the logged in user is associated with, anonymous
+    # users can't be associated with any
+    controlled = request.permissions.venue_ids
+    for venue in page.object_list:
+        venue.controlled = venue.id in controlled
+
+    # Each venue's rooms are a cached fragment, only fetch the rooms of
+    # the venues whose fragment isn't cached
+    stamps = get_object_versions(*((Venue, venue.id) for venue in page.object_list))
+    keys = {}
+    for venue, stamp in zip(page.object_list, stamps):
+        venue.version_stamp = stamp
+        keys[make_template_fragment_key("venue_rooms", [venue.id, stamp])] = venue
+    cached = cache.get_many(keys)
+    missing = [venue for key, venue in keys.items() if key not in cached]
+    prefetch_related_objects(missing, "room_set")
+
     data = {
         "venues": page.object_list,
         "page": page,
@@ -176,18 +200,13 @@ def restricted_page(request):
 def musician_restricted(request, musician_id):
     musician = get_object_or_404(Musician, id=musician_id)
     profile = request.user.userprofile
-    allowed = False
 
-    if profile.musician_profiles.filter(id=musician_id).exists():
-        allowed = True
-    else:
-        # User is not this musician, check if they're a band-mate
-        musician_profiles = set(profile.musician_profiles.all())
-        for band in musician.band_set.all():
-            band_musicians = set(band.musicians.all())
-            if musician_profiles.intersection(band_musicians):
-                allowed = True
-                break
+    # Allowed if the user is this musician, or one of the user's musicians
+    # plays in a band with them. A single query over the indexed
+    # Band.musicians through table, however many bands are involved
+    allowed = profile.musician_profiles.filter(
+        Q(id=musician.id) | Q(band__musicians=musician.id)
+    ).exists()
 
     if not allowed:
         raise Http404("Permission denied")
@@ -204,10 +223,7 @@ def musician_restricted(request, musician_id):
 
 
 def has_venue(user):
-    try:
-        return user.userprofile.venues_controlled.count() > 0
-    except AttributeError:
-        return False
+    return bool(get_permissions(user).venue_ids)
 
 
 @user_passes_test(has_venue)
@@ -219,7 +235,7 @@ def venues_restricted(request):
 def edit_venue(request, venue_id=0):
     if venue_id != 0:
         venue = get_object_or_404(Venue, id=venue_id)
-        if not request.user.userprofile.venues_controlled.filter(id=venue_id).exists():
+        if venue.id not in request.permissions.venue_ids:
             raise Http404("Can only edit controlled venues")
 
     if request.method == "GET":
@@ -249,47 +265,33 @@ def edit_venue(request, venue_id=0):
     return render(request, "edit_venue.html", data)
 
 
+@throttle("search")
 def search_musicians(request):
     search_text = request.GET.get("search_text", "")
     search_text = urllib.parse.unquote(search_text)
     search_text = search_text.strip()
 
-    musicians = []
-
-    if search_text:
-        parts = search_text.split()
-
-        q = Q(first_name__istartswith=parts[0]) | Q(last_name__istartswith=parts[0])
-        for part in parts[1:]:
-            q |= Q(first_name__istartswith=part) | Q(last_name__istartswith=part)
-
-        musicians = Musician.objects.filter(q)
-
-    items_per_page = _get_items_per_page(request)
-    paginator = Paginator(musicians, items_per_page)
-    page_num = _get_page_num(request, paginator)
-    page = paginator.page(page_num)
+    # Best matches first
+    results = find_musicians(search_text)
+    musicians, next_cursor = _get_keyset_page(
+        request, results, ("last_name", "first_name", "id")
+    )
 
     data = {
         "search_text": search_text,
-        "musicians": page.object_list,
-        "has_more": page.has_next(),
-        "next_page": page_num + 1,
+        "musicians": musicians,
+        "next_cursor": next_cursor,
     }
 
     if request.htmx:
-        if page_num > 1:
-            sleep(2)
         return render(request, "partials/musician_results.html", data)
 
     return render(request, "search_musicians.html", data)
 
 
-
-
 @login_required
 def room_editor(request, venue_id):
-    venue = get_object_or_404(Venue, id=venue_id, userprofile=request.user.userprofile)
+    venue = get_object_or_404(Venue, id=venue_id, id__in=request.permissions.venue_ids)
     data = {"venue": venue}
 
     return render(request, "room_editor.html", data)
@@ -301,7 +303,7 @@ def edit_room_form(request, room_id):
 
     if room_id != 0:
         room = get_object_or_404(
-            Room, id=room_id, venue__userprofile=request.user.userprofile
+            Room, id=room_id, venue_id__in=request.permissions.venue_ids
         )
 
     if request.method == "POST":
@@ -328,7 +330,7 @@ def edit_room_form(request, room_id):
 @login_required
 def show_room_partial(request, room_id):
     room = get_object_or_404(
-        Room, id=room.id, venue__userprofile=request.usert.userprofile
+        Room, id=room_id, venue_id__in=request.permissions.venue_ids
     )
 
     data = {"room": room}
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+# A full-text index over seeking ads for content/search.py, only on SQLite
+# (with FTS5). Besides the ad's content it holds the owner's username and
+# the musician and band names, so searches need no joins. The receivers in
+# content/search.py keep it up to date.
+
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE content_seekingad_fts USING fts5(
+        content, owner, musician, band,
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # Index the ads already there
+    """
+    INSERT INTO content_seekingad_fts(rowid, content, owner, musician, band)
+    SELECT ad.id, ad.content, owner.username,
+        COALESCE(musician.first_name || ' ' || musician.last_name, ''),
+        COALESCE(band.name, '')
+    FROM content_seekingad ad
+    JOIN auth_user owner ON owner.id = ad.owner_id
+    LEFT JOIN bands_musician musician ON musician.id = ad.musician_id
+    LEFT JOIN bands_band band ON band.id = ad.band_id
+    """,
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS content_seekingad_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("content", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="seekingad",
+            index=models.Index(fields=["date"], name="content_seekingad_date_idx"),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.db import migrations
+
+# Triggers keeping the seeking ad index from 0002 up to date, replacing the
+# receivers on SeekingAd. Renaming the owner, musician or band reindexes
+# their ads, and so do writes that send no signals: bulk updates, and the
+# SET_NULL update when a musician or band is deleted.
+#
+# Rebuilding one of the tables (e.g. adding a NOT NULL column on SQLite)
+# drops its triggers, such migrations have to create them again.
+
+INDEX = """
+    INSERT INTO content_seekingad_fts(rowid, content, owner, musician, band)
+    SELECT ad.id, ad.content, owner.username,
+        COALESCE(musician.first_name || ' ' || musician.last_name, ''),
+        COALESCE(band.name, '')
+    FROM content_seekingad ad
+    JOIN auth_user owner ON owner.id = ad.owner_id
+    LEFT JOIN bands_musician musician ON musician.id = ad.musician_id
+    LEFT JOIN bands_band band ON band.id = ad.band_id
+    WHERE {where};
+"""
+
+UNINDEX = "DELETE FROM content_seekingad_fts WHERE rowid IN ({rows});"
+
+
+def reindex(column):
+    # The ads pointing at the updated row through ``column``
+    rows = f"SELECT id FROM content_seekingad WHERE {column} = new.id"
+    return UNINDEX.format(rows=rows) + INDEX.format(where=f"ad.{column} = new.id")
+
+
+CREATE = [
+    f"""
+    CREATE TRIGGER content_seekingad_fts_insert AFTER INSERT ON content_seekingad
+    BEGIN
+        {INDEX.format(where="ad.id = new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER content_seekingad_fts_update AFTER UPDATE ON content_seekingad
+    BEGIN
+        {UNINDEX.format(rows="old.id")}
+        {INDEX.format(where="ad.id = new.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER content_seekingad_fts_delete AFTER DELETE ON content_seekingad
+    BEGIN
+        {UNINDEX.format(rows="old.id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER content_seekingad_fts_owner AFTER UPDATE OF username ON auth_user
+    BEGIN
+        {reindex("owner_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER content_seekingad_fts_musician
+    AFTER UPDATE OF first_name, last_name ON bands_musician
+    BEGIN
+        {reindex("musician_id")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER content_seekingad_fts_band AFTER UPDATE OF name ON bands_band
+    BEGIN
+        {reindex("band_id")}
+    END
+    """,
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_insert",
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_update",
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_delete",
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_owner",
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_musician",
+    "DROP TRIGGER IF EXISTS content_seekingad_fts_band",
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE:
+            schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("content", "0002_seekingad_search"),
+        # Created after the musician table was last rebuilt
+        ("bands", "0011_picture_processed"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
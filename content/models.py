@@ -26,6 +26,10 @@ class SeekingAd(models.Model):
         ordering = [
             "date",
         ]
+        indexes = [
+            # Date terms in ad searches filter on ranges of this
+            models.Index(fields=["date"], name="content_seekingad_date_idx"),
+        ]
 
     def __str__(self):
         return f"SeeingAd(id={self.id}, seeking={self.seeking})"
@@ -0,0 +1,157 @@
+import calendar
+import re
+from datetime import date
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from api_pagination import decode_cursor, encode_cursor, finite_float
+from bands.search import fts_query
+from content.models import MusicianBandChoice, SeekingAd
+
+# Full-text search over seeking ads. On SQLite the ads are indexed in the
+# content_seekingad_fts FTS5 table (created in migration 0002) together
+# with the owner's username and the musician and band names, so a search
+# needs no joins. The triggers from migration 0003 keep it up to date.
+
+WORD = re.compile(r"\w+")
+DATE = re.compile(r"^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$")
+SEEKING = re.compile(r"^seeking:(\w+)$", re.IGNORECASE)
+
+# Private-use characters marking matches in snippets, swapped for <mark>
+# tags once the snippet text has been escaped
+START, END = "\ue000", "\ue001"
+
+
+def _date_range(match):
+    # "2024" covers the year, "2024-05" the month, "2024-05-17" the day
+    year, month, day = (int(part) if part else None for part in match.groups())
+    try:
+        if day:
+            start = end = date(year, month, day)
+        elif month:
+            start = date(year, month, 1)
+            end = date(year, month, calendar.monthrange(year, month)[1])
+        else:
+            start, end = date(year, 1, 1), date(year, 12, 31)
+    except ValueError:
+        return None
+
+    return start, end
+
+
+def parse(search_text):
+    """Split ``search_text`` into the words to look up in the index and a
+    dict of filters on indexed columns: ``dates`` (a start, end pair) from
+    terms like 2024, 2024-05 or 2024-05-17, and ``seeking`` from
+    seeking:M or seeking:B.
+    """
+    words = []
+    filters = {}
+    for term in search_text.split():
+        date_match = DATE.match(term)
+        seeking_match = SEEKING.match(term)
+        if date_match and _date_range(date_match):
+            filters["dates"] = _date_range(date_match)
+        elif seeking_match:
+            value = seeking_match.group(1)[0].upper()
+            if value in MusicianBandChoice.values:
+                filters["seeking"] = value
+        else:
+            words.extend(WORD.findall(term))
+
+    return words, filters
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet).replace(START, "<mark>").replace(END, "</mark>"))
+
+
+class RankedAds:
+    """Ads matching an FTS5 query and filters, best match first, read a
+    page at a time with keyset_page(). Each ad gets a ``snippet`` of its
+    content with the matches highlighted.
+    """
+
+    def __init__(self, words, filters):
+        self.query = fts_query(" ".join(words))
+        self.where = ["content_seekingad_fts MATCH %s"]
+        self.params = [self.query]
+        if "dates" in filters:
+            self.where.append("ad.date BETWEEN %s AND %s")
+            self.params.extend(day.isoformat() for day in filters["dates"])
+        if "seeking" in filters:
+            self.where.append("ad.seeking = %s")
+            self.params.append(filters["seeking"])
+
+    def keyset_page(self, after, limit):
+        # Pages follow on from the (rank, id) of the last row, so a later
+        # page costs no more than the first
+        where = list(self.where)
+        params = list(self.params)
+        if after:
+            rank, pk = decode_cursor(after, (finite_float, int))
+            where.append(
+                "(content_seekingad_fts.rank > %s OR "
+                "(content_seekingad_fts.rank = %s AND ad.id > %s))"
+            )
+            params += [rank, rank, pk]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT ad.id, content_seekingad_fts.rank, "
+                f"snippet(content_seekingad_fts, 0, '{START}', '{END}', '...', 16) "
+                "FROM content_seekingad_fts "
+                "JOIN content_seekingad ad ON ad.id = content_seekingad_fts.rowid "
+                f"WHERE {' AND '.join(where)} "
+                "ORDER BY content_seekingad_fts.rank, ad.id LIMIT %s",
+                [*params, limit + 1],
+            )
+            rows = cursor.fetchall()
+
+        ads = SeekingAd.objects.in_bulk([pk for pk, _, _ in rows[:limit]])
+        page = []
+        for pk, _, snippet in rows[:limit]:
+            if pk in ads:
+                ads[pk].snippet = _highlight(snippet)
+                page.append(ads[pk])
+
+        if len(rows) <= limit:
+            return page, None
+
+        pk, rank, _ = rows[limit - 1]
+        return page, encode_cursor([rank, pk])
+
+
+def find_ads(search_text):
+    """Ads matching ``search_text``. Words are matched as prefixes against
+    the ad's content, owner, musician and band, date and seeking: terms
+    become filters. Uses the FTS5 index on SQLite and falls back to the ORM
+    elsewhere.
+    """
+    words, filters = parse(search_text)
+    if not words and not filters:
+        return SeekingAd.objects.none()
+
+    if words and connection.vendor == "sqlite":
+        return RankedAds(words, filters)
+
+    ads = SeekingAd.objects.all()
+    if "dates" in filters:
+        ads = ads.filter(date__range=filters["dates"])
+    if "seeking" in filters:
+        ads = ads.filter(seeking=filters["seeking"])
+
+    q = Q()
+    for word in words:
+        q |= (
+            Q(owner__username__istartswith=word)
+            | Q(musician__first_name__istartswith=word)
+            | Q(musician__last_name__istartswith=word)
+            | Q(band__name__istartswith=word)
+            | Q(content__icontains=word)
+        )
+
+    return ads.filter(q)
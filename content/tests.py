@@ -1,3 +1,93 @@
+from datetime import date
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
+from api_pagination import encode_cursor
+from bands.models import Band, Musician
+from content.models import SeekingAd
+
 # Create your tests here.
+
+
+class TestSearchAds(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user("owner", password="notsecure")
+        self.band = Band.objects.create(name="Noisemakers")
+        self.musician = Musician.objects.create(
+            first_name="Zoë", last_name="Keys", birth=date(1900, 1, 1)
+        )
+
+    def search(self, text):
+        response = self.client.get("/content/search-ads/", {"search_text": text})
+        self.assertEqual(200, response.status_code)
+        return response
+
+    def ad_ids(self, text):
+        return [ad.id for ad in self.search(text).context["ads"]]
+
+    def test_search(self):
+        drummer = SeekingAd.objects.create(
+            owner=self.owner,
+            seeking="M",
+            band=self.band,
+            content="Drummer wanted, drums drums drums <b>now</b>",
+        )
+        keys = SeekingAd.objects.create(
+            owner=self.owner,
+            seeking="B",
+            musician=self.musician,
+            content="Keyboard player looking for a band that needs a drummer",
+        )
+
+        # Prefix matches over content and names, best match first
+        self.assertEqual([drummer.id, keys.id], self.ad_ids("drum"))
+        self.assertEqual([keys.id], self.ad_ids("zoe"))
+        self.assertEqual([drummer.id], self.ad_ids("noisemak"))
+
+        # Structured terms become filters
+        self.assertEqual([keys.id], self.ad_ids("drum seeking:B"))
+        today = date.today()
+        self.assertEqual(2, len(self.ad_ids(f"drum {today:%Y-%m}")))
+        self.assertEqual([], self.ad_ids(f"drum {today.year - 1}"))
+        self.assertEqual([drummer.id], self.ad_ids("seeking:m"))
+
+        # Snippets highlight the matches and escape the ad's text
+        response = self.search("wanted")
+        self.assertContains(response, "<mark>wanted</mark>")
+        self.assertContains(response, "&lt;b&gt;now&lt;/b&gt;")
+
+        # The index follows edits and deletes
+        drummer.content = "Bass player wanted"
+        drummer.save()
+        self.assertEqual([keys.id], self.ad_ids("drum"))
+        keys.delete()
+        self.assertEqual([], self.ad_ids("drum"))
+
+        # And renames of the owner, musician and band
+        ad = SeekingAd.objects.create(
+            owner=self.owner, seeking="B", musician=self.musician, band=self.band
+        )
+        self.band.name = "Quietones"
+        self.band.save()
+        self.assertEqual([], self.ad_ids("noisemak"))
+        self.assertCountEqual([drummer.id, ad.id], self.ad_ids("quieton"))
+        Musician.objects.filter(id=self.musician.id).update(first_name="Ada")
+        self.assertEqual([ad.id], self.ad_ids("ada"))
+        self.owner.username = "renamed"
+        self.owner.save()
+        self.assertCountEqual([drummer.id, ad.id], self.ad_ids("renamed"))
+
+        # Deleting the band sets the ad's band to NULL without signals
+        self.band.delete()
+        self.assertEqual([], self.ad_ids("quieton"))
+        self.assertEqual([ad.id], self.ad_ids("ada"))
+
+    def test_bad_cursor(self):
+        url = "/content/search-ads/"
+        # Ranked by the index, and date ordered when there are only filters
+        for text in ("drummer", "2024"):
+            for values in (["x", "y"], [{}, 1], ["2024-13-45", 1], [None, None]):
+                data = {"search_text": text, "after": encode_cursor(values)}
+                response = self.client.get(url, data)
+                self.assertEqual(400, response.status_code)
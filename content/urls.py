@@ -1,12 +1,14 @@
 from django.urls import path
+from django_distill import distill_path
 
 
 from content import views
+from static_site import no_params
 
 urlpatterns = [
     path("comment/", views.comment, name="comment"),
     path("comment-accepted/", views.comment_accepted, name="comment_accepted"),
-    path("list-ads/", views.list_ads, name="list_ads"),
+    distill_path("list-ads/", views.list_ads, name="list_ads", distill_func=no_params),
     path("seeking-ad/", views.seeking_ad, name="seeking_ad"),
     path("edit-seeking-ad/<int:ad_id>", views.seeking_ad, name="edit_seeking_ad"),
     path("search-ads/", views.search_ads, name="search_ads"),
@@ -1,14 +1,13 @@
 import urllib
-from time import sleep
-from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.core.mail import send_mail
-from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
 
 from content.forms import CommentForm, SeekingAdForm
 from content.models import MusicianBandChoice, SeekingAd
-from bands.views import _get_items_per_page, _get_page_num
+from content.search import find_ads
+from bands.views import _get_keyset_page
+from throttling import throttle
 
 # Create your views here.
 
@@ -98,55 +97,23 @@ def seeking_ad(request, ad_id=0):
     return render(request, "seeking_ad.html", data)
 
 
+@throttle("search")
 def search_ads(request):
     search_text = request.GET.get("search_text", "")
     search_text = urllib.parse.unquote(search_text)
     search_text = search_text.strip()
 
-    ads = []
-
-    if search_text:
-        parts = search_text.split()
-
-        q = (
-            Q(date__istartswith=parts[0])
-            | Q(owner__username__istartswith=parts[0])
-            | Q(seeking__istartswith=parts[0])
-            | Q(musician__first_name__istartswith=parts[0])
-            | Q(musician__last_name__istartswith=parts[0])
-            | Q(band__name__istartswith=parts[0])
-            | Q(content__icontains=parts[0])
-        )
-
-        # Add the rest of the parts
-        for part in parts[1:]:
-            q |= (
-                Q(date__istartswith=part)
-                | Q(owner__username__istartswith=part)
-                | Q(seeking__istartswith=part)
-                | Q(musician__first_name__istartswith=part)
-                | Q(musician__last_name__istartswith=part)
-                | Q(band__name__istartswith=part)
-                | Q(content__icontains=part)
-            )
-
-        ads = SeekingAd.objects.filter(q)
-
-    items_per_page = _get_items_per_page(request)
-    paginator = Paginator(ads, items_per_page)
-    page_num = _get_page_num(request, paginator)
-    page = paginator.page(page_num)
+    # Best matches first, date and seeking:M/B terms filter the results
+    results = find_ads(search_text)
+    ads, next_cursor = _get_keyset_page(request, results, ("date", "id"))
 
     data = {
         "search_text": search_text,
-        "ads": page.object_list,
-        "has_more": page.has_next(),
-        "next_page": page_num + 1,
+        "ads": ads,
+        "next_cursor": next_cursor,
     }
 
     if request.htmx:
-        if page_num > 1:
-            sleep(2)
         return render(request, "partials/ad_results.html", data)
 
     return render(request, "search_ads.html", data)
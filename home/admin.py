@@ -1,3 +1,14 @@
 from django.contrib import admin
 
 # Register your models here.
+from home.models import APIKey
+
+
+@admin.register(APIKey)
+class APIKeyAdmin(admin.ModelAdmin):
+    list_display = ("name", "prefix", "scopes", "created", "expires", "revoked")
+    readonly_fields = ("prefix", "created")
+
+    def has_add_permission(self, request):
+        # The raw key is only shown once, use "manage.py create_api_key"
+        return False
@@ -4,11 +4,11 @@ router = Router()
 
 
 @router.get("/")
-def home(request):
+async def home(request):
     return "RiffMates rocks!"
 
 
 @router.get("/version/")
-def version(request):
+async def version(request):
     data = {"version": "0.0.1"}
     return data
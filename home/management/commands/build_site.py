@@ -0,0 +1,110 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django_distill.renderer import DistillRenderer, render_pattern, write_file
+from django_distill.request import get_static_filepath
+from django_distill.urls import get_distilled_url_by_name
+
+from static_site import PageStamps
+
+MANIFEST = ".manifest.json"
+
+
+def render_page(name, params, output_dir):
+    """Render distilled page ``name`` into ``output_dir``, returns the
+    path of the file written. Runs in the worker processes.
+    """
+    pattern = get_distilled_url_by_name(name)
+    with DistillRenderer([pattern]):
+        uri, filename, _, _, body = render_pattern(pattern, params, None)
+
+    path, _ = get_static_filepath(Path(output_dir), filename, uri)
+    write_file(Path(path), body)
+    return str(path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the public pages as static files, only rendering the pages "
+        "whose content changed since the last build. Changes are found by "
+        "hashing the rows each page shows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output_dir", help="Directory to write the site to.")
+
+        parser.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes rendering pages, defaults to one per CPU.",
+        )
+
+        parser.add_argument(
+            "--force",
+            "-f",
+            action="store_true",
+            help="Render every page, e.g. after a template change.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        output_dir = Path(options["output_dir"])
+        manifest_path = output_dir / MANIFEST
+        manifest = {}
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+
+        # Stamps are read before rendering, a write made while a page
+        # renders leaves it out of date in the manifest and the next build
+        # renders it again
+        pages = {}
+        stale = []
+        page_stamp = PageStamps()
+        with DistillRenderer() as renderer:
+            for pattern, params, uri in renderer.get_urls_to_render():
+                stamp = page_stamp(pattern.name, params)
+                pages[uri] = {"stamp": stamp}
+                built = manifest.get(uri, {}).get("stamp")
+                if options["force"] or built != stamp:
+                    stale.append((uri, pattern.name, params))
+
+        for uri, _, _ in stale:
+            self.stdout.write(f"Rendering {uri}")
+        paths = self._render(stale, output_dir, options["workers"])
+        for (uri, _, _), path in zip(stale, paths):
+            pages[uri]["path"] = path
+
+        # Pages of deleted rows
+        for uri, page in manifest.items():
+            if uri not in pages:
+                self.stdout.write(f"Removing {uri}")
+                Path(page["path"]).unlink(missing_ok=True)
+            elif "path" not in pages[uri]:
+                pages[uri]["path"] = page["path"]
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile("w", dir=output_dir, suffix=".tmp", delete=False) as f:
+            json.dump(pages, f)
+        os.replace(f.name, manifest_path)
+
+        self.stdout.write(f"Rendered {len(stale)} of {len(pages)} pages")
+
+    def _render(self, stale, output_dir, workers):
+        args = [(name, params, output_dir) for _, name, params in stale]
+        if workers == 1 or len(args) < 2:
+            return [render_page(*arg) for arg in args]
+
+        # Connections mustn't be shared with forked workers
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=django.setup) as executor:
+            return list(executor.map(render_page, *zip(*args), chunksize=16))
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from home.models import APIKey
+
+
+class Command(BaseCommand):
+    help = "Create an API key. The key is only ever shown in this command's output."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", help="Who or what the key is for.")
+
+        parser.add_argument(
+            "--scope",
+            "-s",
+            action="append",
+            default=[],
+            help="Scope granted to the key, can be repeated (e.g. -s write).",
+        )
+
+        parser.add_argument(
+            "--expires-days",
+            "-e",
+            type=int,
+            help="Number of days until the key expires, defaults to never.",
+        )
+
+    def handle(self, *args, **options):
+        expires = None
+        if options["expires_days"] is not None:
+            if options["expires_days"] < 1:
+                raise CommandError("--expires-days must be at least 1.")
+            expires = timezone.now() + timedelta(days=options["expires_days"])
+
+        api_key, raw_key = APIKey.generate(
+            options["name"], " ".join(options["scope"]), expires
+        )
+
+        self.stdout.write(f"Created {api_key}")
+        self.stdout.write(raw_key)
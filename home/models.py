@@ -1,3 +1,52 @@
+import secrets
+from hashlib import sha256
+
 from django.db import models
+from django.utils import timezone
+
+
+def hash_key(raw_key):
+    return sha256(raw_key.encode()).hexdigest()
+
+
+class APIKey(models.Model):
+    # Keys look like "<prefix>.<secret>". Only the prefix, used to find the
+    # row, and a hash of the whole key are stored.
+    name = models.CharField(max_length=50)
+    prefix = models.CharField(max_length=8, unique=True, editable=False)
+    hashed_key = models.CharField(max_length=64, editable=False)
+    scopes = models.CharField(
+        max_length=200, blank=True, help_text="Space separated, e.g. 'read write'"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(blank=True, null=True)
+    revoked = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "API key"
+        ordering = ["name"]
+
+    def __str__(self):
+        return f"APIKey(prefix={self.prefix}, name={self.name})"
+
+    @classmethod
+    def generate(cls, name, scopes="", expires=None):
+        # Returns the new APIKey and the raw key, which can't be recovered
+        # once this call returns
+        prefix = secrets.token_hex(4)
+        raw_key = f"{prefix}.{secrets.token_urlsafe(32)}"
+        api_key = cls.objects.create(
+            name=name,
+            prefix=prefix,
+            hashed_key=hash_key(raw_key),
+            scopes=scopes,
+            expires=expires,
+        )
+
+        return api_key, raw_key
 
-# Create your models here.
+    @property
+    def is_active(self):
+        if self.revoked:
+            return False
+        return self.expires is None or self.expires > timezone.now()
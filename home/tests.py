@@ -1,4 +1,20 @@
-from django.test import TestCase
+import json
+import subprocess
+import sys
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from bands.models import Band, Musician
+from home.models import APIKey
+from RiffMates import metrics
 
 # Create your tests here.
 
@@ -7,3 +23,156 @@ class TestHome(TestCase):
     def test_credit(self):
         response = self.client.get("/credits/")
         self.assertEqual(200, response.status_code)
+
+    def test_metrics(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        _, key = APIKey.generate("Scraper", "metrics")
+        _, other_key = APIKey.generate("Writer", "write")
+
+        with override_settings(METRICS_DIR=directory.name):
+            self.client.get("/credits/")
+            self.client.get("/api/v1/bands/bands/")
+            self.assertEqual(403, self.client.get("/metrics/").status_code)
+            response = self.client.get("/metrics/", headers={"X-API-KEY": other_key})
+            self.assertEqual(403, response.status_code)
+            response = self.client.get("/metrics/", headers={"X-API-KEY": key})
+
+        self.assertEqual(200, response.status_code)
+        text = response.content.decode()
+        self.assertIn('riffmates_request_duration_seconds_count{route="credits"}', text)
+        self.assertIn(
+            'riffmates_request_duration_seconds_bucket{route="credits",le="+Inf"}', text
+        )
+        # The band list is served by an async view, its queries run in
+        # another thread and still count
+        for line in text.splitlines():
+            if line.startswith('riffmates_sql_queries_total{route="api-1.0:bands"}'):
+                self.assertGreater(int(line.split()[-1]), 0)
+                break
+        else:
+            self.fail("No SQL count for api-1.0:bands")
+
+        # Staff can look too
+        user = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(user)
+        with override_settings(METRICS_DIR=directory.name):
+            self.assertEqual(200, self.client.get("/metrics/").status_code)
+
+    def test_metrics_retired(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        user = User.objects.create_user("staff", password="password", is_staff=True)
+        self.client.force_login(user)
+
+        # A process that is gone, its pid may be reused
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        gone = Path(directory.name) / f"{metrics.HOST}-{process.pid}-x.json"
+        stats = metrics._new_route()
+        stats[0][-1] = stats[1] = 3
+        gone.write_text(json.dumps({"gone": stats}))
+        # Another host's
+        other = Path(directory.name) / f"other-{process.pid}-x.json"
+        other.write_text(json.dumps({"other": stats}))
+
+        count = 'riffmates_request_duration_seconds_count{route="%s"} 3'
+        with override_settings(METRICS_DIR=directory.name):
+            for _ in range(2):
+                text = self.client.get("/metrics/").content.decode()
+                self.assertIn(count % "gone", text)
+                self.assertIn(count % "other", text)
+                self.assertFalse(gone.exists())
+                self.assertTrue(other.exists())
+
+        # This process's file is kept
+        files = {path.name for path in Path(directory.name).glob("*.json")}
+        self.assertEqual({metrics.RETIRED, other.name, metrics._file_name}, files)
+
+    def test_metrics_unwritable(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # No directory can be made under a file
+        blocked = Path(directory.name) / "file"
+        blocked.write_text("")
+
+        with override_settings(METRICS_DIR=str(blocked / "metrics")):
+            with patch.object(metrics, "FLUSH_INTERVAL", -1):
+                with self.assertLogs("RiffMates.metrics", "ERROR"):
+                    response = self.client.get("/credits/")
+                    # The flush runs after the response, wait for it
+                    metrics._flusher.submit(lambda: None).result()
+            self.assertEqual(200, response.status_code)
+
+            user = User.objects.create_user("staff", is_staff=True)
+            self.client.force_login(user)
+            with self.assertLogs("RiffMates.metrics", "ERROR"):
+                response = self.client.get("/metrics/")
+            self.assertEqual(200, response.status_code)
+
+    def test_build_site(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        site = Path(directory.name)
+
+        def build():
+            out = StringIO()
+            call_command("build_site", directory.name, workers=1, stdout=out)
+            return [
+                line.split()[1]
+                for line in out.getvalue().splitlines()
+                if line.startswith(("Rendering ", "Removing "))
+            ]
+
+        birth = date(1900, 1, 1)
+        musician = Musician.objects.create(first_name="A", last_name="B", birth=birth)
+        other = Musician.objects.create(first_name="C", last_name="D", birth=birth)
+        band = Band.objects.create(name="The Band")
+        band.musicians.add(musician)
+
+        self.assertEqual(9, len(build()))
+        page = site / f"bands/musician/{musician.id}/index.html"
+        self.assertIn("The Band", page.read_text())
+        self.assertTrue((site / "bands/venues/index.html").exists())
+
+        # Nothing changed, also for a new process with an empty cache
+        self.assertEqual([], build())
+        cache.clear()
+        self.assertEqual([], build())
+
+        # Writes that send no signals are picked up too
+        Musician.objects.filter(id=other.id).update(last_name="E")
+        self.assertEqual(
+            sorted(
+                [
+                    f"/bands/musician/{other.id}/",
+                    "/bands/musicians/",
+                    "/content/list-ads/",
+                ]
+            ),
+            sorted(build()),
+        )
+
+        band.name = "Renamed"
+        band.save()
+        self.assertEqual(
+            sorted(
+                [
+                    f"/bands/musician/{musician.id}/",
+                    f"/bands/band/{band.id}/",
+                    "/bands/bands/",
+                    "/content/list-ads/",
+                ]
+            ),
+            sorted(build()),
+        )
+        self.assertIn("Renamed", page.read_text())
+
+        other_id = other.id
+        other.delete()
+        self.assertIn(f"/bands/musician/{other_id}/", build())
+        other_page = site / f"bands/musician/{other_id}/index.html"
+        self.assertFalse(other_page.exists())
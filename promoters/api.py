@@ -1,6 +1,11 @@
 from ninja import Router, ModelSchema
-from django.shortcuts import get_object_or_404
+from ninja.decorators import decorate_view
+from django.shortcuts import aget_object_or_404
+
+from api_caching import cached_response
+from api_optimize import optimize
 from promoters.models import Promoter
+from throttling import TokenBucketThrottle
 
 router = Router()
 
@@ -11,12 +16,21 @@ class PromoterSchema(ModelSchema):
         fields = ["id", "full_name", "birth", "death"]
 
 
-@router.get("/promoters/", response=list[PromoterSchema])
-def promoters(request):
-    return Promoter.objects.all()
+@router.get(
+    "/promoters/",
+    response=list[PromoterSchema],
+    throttle=TokenBucketThrottle("api-list"),
+)
+@decorate_view(cached_response(Promoter))
+async def promoters(request):
+    promoters = optimize(Promoter.objects.all(), PromoterSchema)
+    return [promoter async for promoter in promoters]
 
 
 @router.get("/promoter/{promoter_id}", response=PromoterSchema)
-def promoter(request, promoter_id):
-    promoter = get_object_or_404(Promoter, id=promoter_id)
+@decorate_view(cached_response(objects={"promoter_id": Promoter}))
+async def promoter(request, promoter_id: int):
+    promoter = await aget_object_or_404(
+        optimize(Promoter.objects.all(), PromoterSchema), id=promoter_id
+    )
     return promoter
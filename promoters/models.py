@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from versions import bump_object_versions, bump_version
 
 
 # Create your models here.
@@ -14,3 +18,9 @@ class Promoter(models.Model):
     # country = models.CharField(max_length=50, null=True)
     # postal_zip_code = models.CharField(max_length=50, null=True)
     # address = models.CharField(max_length=200, null=True, blank=True)
+
+
+@receiver([post_save, post_delete], sender=Promoter)
+def bump_promoter_versions(sender, **kwargs):
+    bump_version(sender)
+    bump_object_versions(sender, [kwargs["instance"].pk])
@@ -1,8 +1,14 @@
-from django.urls import path
+from django_distill import distill_path
 
 from promoters import views
+from static_site import no_params
 
 urlpatterns = [
-    path("", views.promoters, name="promoters"),
-    path("partial-promoters/", views.partial_promoters, name="partial_promoters"),
+    distill_path("", views.promoters, name="promoters", distill_func=no_params),
+    distill_path(
+        "partial-promoters/",
+        views.partial_promoters,
+        name="partial_promoters",
+        distill_func=no_params,
+    ),
 ]
@@ -1,5 +1,4 @@
 from django.shortcuts import render
-from time import sleep
 
 # Create your views here.
 from promoters.models import Promoter
@@ -10,6 +9,5 @@ def promoters(request):
 
 
 def partial_promoters(request):
-    sleep(2)
     data = {"promoters": Promoter.objects.all()}
     return render(request, "partials/promoters.html", data)
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from hashlib import sha1
+
+from bands.models import Band, Musician, Room, Venue
+from content.models import SeekingAd
+from promoters.models import Promoter
+
+# The public pages exported by django_distill, see the build_site command.
+#
+# Each distilled URL names a function here listing its parameters, and has
+# an entry in PAGE_STAMPS hashing the rows its content comes from. A page
+# is only rendered again when its stamp changed since the last build. The
+# stamps are read from the database, so they hold across processes and
+# whatever cache backend is configured.
+
+
+def musician_params():
+    for musician_id in Musician.objects.values_list("id", flat=True):
+        yield {"musician_id": musician_id}
+
+
+def band_params():
+    for band_id in Band.objects.values_list("id", flat=True):
+        yield {"band_id": band_id}
+
+
+def no_params():
+    return None
+
+
+def _digest(*parts):
+    return sha1(repr(parts).encode()).hexdigest()
+
+
+def _rows(model):
+    # Every column of every row, by primary key
+    rows = model.objects.order_by("pk").values_list()
+    return {row[0]: row for row in rows}
+
+
+def _table_stamp(*models):
+    def stamp():
+        digest = _digest(*(list(_rows(model).values()) for model in models))
+        return lambda params: digest
+
+    return stamp
+
+
+def _member_stamps(model, other, own, others):
+    # Per ``model`` row: the row and the ``other`` rows it's linked to
+    # through band membership, ``own`` and ``others`` being the columns of
+    # the membership table pointing at each
+    rows = _rows(model)
+    other_rows = _rows(other)
+    linked = defaultdict(list)
+    memberships = Band.musicians.through.objects.order_by(own, others)
+    for pk, other_pk in memberships.values_list(own, others):
+        linked[pk].append(other_rows[other_pk])
+
+    return {pk: _digest(row, linked[pk]) for pk, row in rows.items()}
+
+
+def _musician_stamps():
+    # Musician pages list their bands
+    stamps = _member_stamps(Musician, Band, "musician_id", "band_id")
+    return lambda params: stamps.get(params["musician_id"])
+
+
+def _band_stamps():
+    stamps = _member_stamps(Band, Musician, "band_id", "musician_id")
+    return lambda params: stamps.get(params["band_id"])
+
+
+# Page name -> function reading the stamps of all its pages in a few
+# queries, returning a function of the page's parameters
+PAGE_STAMPS = {
+    "musician": _musician_stamps,
+    "band": _band_stamps,
+    "musicians": _table_stamp(Musician),
+    "bands": _table_stamp(Band),
+    "venues": _table_stamp(Venue, Room),
+    "list_ads": _table_stamp(SeekingAd, Musician, Band),
+    # The promoters page is a shell loading the list with htmx
+    "promoters": _table_stamp(),
+    "partial_promoters": _table_stamp(Promoter),
+}
+
+
+class PageStamps:
+    """Stamps of the pages' content, read from the database the first
+    time a page of each name is asked for. Use one per build.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+
+    def __call__(self, name, params):
+        if name not in self.loaded:
+            self.loaded[name] = PAGE_STAMPS[name]()
+        return self.loaded[name](params or {})
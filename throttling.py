@@ -0,0 +1,94 @@
+from functools import wraps
+from math import ceil
+from threading import local
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from ninja.throttling import BaseThrottle
+
+# Token buckets are kept in the shared cache so limits hold across worker
+# processes. Reading and writing a bucket isn't atomic, so concurrent
+# requests from the same client can occasionally get one or two tokens
+# more than the rate allows, which is fine for abuse protection.
+
+PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600}
+
+
+def parse_rate(rate):
+    # "30/min" -> (30 tokens, refilled at 0.5 tokens per second)
+    count, _, period = rate.partition("/")
+    count = int(count)
+    return count, count / PERIODS[period]
+
+
+def get_ident(request):
+    # Clients with an API key get their own bucket wherever they call
+    # from, anyone else is limited by address
+    key_id = getattr(getattr(request, "auth", None), "key_id", None)
+    if key_id is not None:
+        return f"key:{key_id}"
+
+    return f"ip:{BaseThrottle().get_ident(request)}"
+
+
+def take_token(scope, ident):
+    """Take a token from the ``scope`` bucket of ``ident``. Returns 0 when
+    the request is allowed, or the seconds until a token is available.
+    """
+    rate = settings.THROTTLE_RATES.get(scope)
+    if rate is None:
+        return 0
+
+    capacity, refill = parse_rate(rate)
+    key = f"throttle:{scope}:{ident}"
+    now = time()
+
+    tokens, updated = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * refill)
+    if tokens < 1:
+        return (1 - tokens) / refill
+
+    # Expire the bucket once it would be full again anyway
+    cache.set(key, (tokens - 1, now), timeout=ceil(capacity / refill))
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ninja throttle drawing from the token bucket of ``scope``, with the
+    rate set in ``settings.THROTTLE_RATES``. Ninja runs throttles after
+    authentication and before the view, and answers 429 with Retry-After.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        # Operations share throttle instances across threads
+        self.state = local()
+
+    def allow_request(self, request):
+        self.state.wait = take_token(self.scope, get_ident(request))
+        return not self.state.wait
+
+    def wait(self):
+        return getattr(self.state, "wait", None) or None
+
+
+def throttle(scope):
+    """The same limit as TokenBucketThrottle for plain Django views."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = take_token(scope, get_ident(request))
+            if wait:
+                response = HttpResponse("Too many requests", status=429)
+                response["Retry-After"] = str(ceil(wait))
+                return response
+
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,110 @@
+from time import time_ns
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Version counters are kept in the cache so every worker process sees the
+# same values. A counter that is missing (never set, or evicted) is seeded
+# from the clock, so it can never come back with a value handed out before.
+#
+# Models have one counter covering the whole table, and each object has its
+# own counter for things that only depend on that object.
+#
+# Counters are bumped once the writing transaction commits. Bumped any
+# earlier, a reader could cache the rows from before the commit under the
+# new version.
+#
+# That only holds with a cache shared by every process writing or serving
+# the data, check_shared_cache() warns about the per-process LocMemCache.
+
+
+def _model_key(model):
+    return f"version:{model._meta.label_lower}"
+
+
+def _object_key(model, pk):
+    return f"version:{model._meta.label_lower}:{pk}"
+
+
+def _get_many(keys):
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+async def _aget_many(keys):
+    versions = await cache.aget_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+
+    return [versions[key] for key in keys]
+
+
+def get_versions(*models):
+    return _get_many([_model_key(model) for model in models])
+
+
+async def aget_versions(*models):
+    return await _aget_many([_model_key(model) for model in models])
+
+
+def get_object_versions(*objects):
+    """Versions of ``(model, pk)`` pairs."""
+    return _get_many([_object_key(model, pk) for model, pk in objects])
+
+
+async def aget_object_versions(*objects):
+    return await _aget_many([_object_key(model, pk) for model, pk in objects])
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time_ns(), timeout=None)
+
+
+def bump_version(model):
+    key = _model_key(model)
+    transaction.on_commit(lambda: _incr(key))
+
+
+def bump_object_versions(model, pks):
+    # Dropping the counters is enough, they're re-seeded from the clock
+    # when next read, and it takes one round trip for any number of objects
+    keys = [_object_key(model, pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # A single runserver process is fine while developing
+    if settings.DEBUG or not isinstance(caches["default"], LocMemCache):
+        return []
+
+    return [
+        checks.Warning(
+            "The default cache is a LocMemCache, which every process keeps "
+            "for itself.",
+            hint=(
+                "API ETags and cached responses go by version counters in "
+                "the cache. With more than one worker, or writes "
+                "from management commands, other processes keep serving "
+                "stale data. Set CACHE_BACKEND to a shared backend such as "
+                "Redis or Memcached."
+            ),
+            id="versions.W001",
+        )
+    ]